@@ -0,0 +1,153 @@
+"""
+Desktop actions used by interactive_demo.py and proper_multistep.py.
+
+Every action returns {"status": ..., "message": ...} so results can be sent
+back to the model as tool responses. Keyboard and mouse actions share the
+"input" concurrency class so a ToolExecutor never runs two of them at once,
+and wait for apps launched earlier in the turn to come up; process launches
+and web searches run in parallel.
+
+There are no fixed delays: open_app returns once the launched app's window
+has taken focus (see readiness.py), and waiting is done with non-blocking
+awaits.
+"""
+
+import subprocess
+
+from readiness import LAUNCH_TIMEOUT, foreground_window, window_ready
+from registry import ToolRegistry
+
+registry = ToolRegistry()
+
+def _pyautogui():
+    """pyautogui, imported on first use: it is slow to import and needs a display"""
+    import pyautogui
+    return pyautogui
+
+# Map common app names to executables
+APP_MAP = {
+    'notepad': 'notepad.exe',
+    'calculator': 'calc.exe',
+    'calc': 'calc.exe',
+    'paint': 'mspaint.exe',
+    'mspaint': 'mspaint.exe',
+    'cmd': 'cmd.exe',
+    'command prompt': 'cmd.exe',
+    'chrome': 'chrome.exe',
+    'edge': 'msedge.exe',
+    'explorer': 'explorer.exe',
+    'file explorer': 'explorer.exe'
+}
+
+@registry.tool(timeout=LAUNCH_TIMEOUT + 2)
+async def open_app(app_name: str):
+    """
+    Open an application by name
+
+    Args:
+        app_name: Name of the application (e.g., notepad, chrome, calculator)
+    """
+    app_name = app_name.strip()  # Remove leading/trailing spaces
+    try:
+        before = foreground_window()
+        process = subprocess.Popen(APP_MAP.get(app_name.lower(), app_name))
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to open {app_name}: {e}"}
+    # Return once the app can take input, not after a guessed delay
+    if await window_ready(process, before):
+        return {"status": "success", "message": f"Opened {app_name}"}
+    return {"status": "success", "message": f"Opened {app_name} (window not focused yet)"}
+
+@registry.tool(concurrency="input", timeout=30, after=("open_app",))
+def type_text(text: str):
+    """
+    Type text using keyboard
+
+    Args:
+        text: The text to type
+    """
+    try:
+        _pyautogui().write(text, interval=0.05)
+        return {"status": "success", "message": f"Typed: {text}"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@registry.tool(concurrency="input", timeout=5, after=("open_app",))
+def press_key(key: str):
+    """
+    Press a keyboard key or key combination
+
+    Args:
+        key: Key name (e.g., enter, ctrl+s, alt+f4)
+    """
+    try:
+        if '+' in key:
+            # Handle key combinations like ctrl+s
+            _pyautogui().hotkey(*key.split('+'))
+        else:
+            _pyautogui().press(key)
+        return {"status": "success", "message": f"Pressed: {key}"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@registry.tool(concurrency="input", timeout=5, after=("open_app",))
+def click_mouse(x: int = None, y: int = None):
+    """
+    Click the mouse at current position or coordinates
+
+    Args:
+        x: X coordinate (optional)
+        y: Y coordinate (optional)
+    """
+    try:
+        if x is not None and y is not None:
+            _pyautogui().click(x, y)
+            return {"status": "success", "message": f"Clicked at ({x}, {y})"}
+        _pyautogui().click()
+        return {"status": "success", "message": "Clicked at current position"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@registry.tool(timeout=5)
+def set_volume(level: int):
+    """
+    Set system volume level
+
+    Args:
+        level: Volume level 0-100
+    """
+    return {"status": "success", "message": f"Volume set to {level}%"}
+
+@registry.tool
+async def wait(seconds: int):
+    """
+    Wait for a specified number of seconds
+
+    Args:
+        seconds: Number of seconds to wait
+    """
+    import asyncio
+    await asyncio.sleep(seconds)
+    return {"status": "success", "message": f"Waited {seconds} seconds"}
+
+@registry.tool(timeout=10)
+def search_web(query: str):
+    """
+    Search the web for a query
+
+    Args:
+        query: Search query
+    """
+    import webbrowser
+    try:
+        webbrowser.open(f"https://www.google.com/search?q={query}")
+        return {"status": "success", "message": f"Searching for: {query}"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@registry.tool
+def task_done():
+    """
+    Indicate that the task is complete.
+    """
+    return {"status": "complete", "message": "Task finished"}
@@ -0,0 +1,258 @@
+"""
+Continuous (iteration-level) batching for concurrent completion requests.
+
+Instead of running model.generate once per request, a single scheduler thread
+owns the model and runs one decode loop for everyone: each iteration it admits
+newly queued requests (prefilling them individually), decodes one token for
+every active sequence in a single batched forward pass, and retires finished
+sequences immediately so new ones can take their slot.
+
+The batched KV cache is kept left-padded; positions are tracked per sequence so
+padding never shifts RoPE positions. Decoding is greedy.
+
+    python batching.py --clients 8 --requests 32    # compare against sequential
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from transformers import DynamicCache
+
+from stopping import CallStops
+
+class _Sequence:
+    """One in-flight request inside the batch"""
+
+    def __init__(self, input_ids, max_new_tokens, max_calls, future):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.max_calls = max_calls
+        self.future = future
+        self.generated = []
+        self.length = len(input_ids)  # real (unpadded) tokens in the cache
+        self.done = False
+
+def _left_pad(layers, mask, length):
+    """Left-pad every layer's keys/values and the attention mask to length"""
+    pad = length - mask.shape[1]
+    if pad == 0:
+        return layers, mask
+    padded = []
+    for key, value in layers:
+        shape = list(key.shape)
+        shape[2] = pad
+        padded.append((
+            torch.cat([key.new_zeros(shape), key], dim=2),
+            torch.cat([value.new_zeros(shape), value], dim=2)
+        ))
+    return padded, torch.cat([mask.new_zeros((mask.shape[0], pad)), mask], dim=1)
+
+class ContinuousBatcher:
+    """Merges concurrent requests into one token-level decode loop"""
+
+    def __init__(self, processor, model, max_batch_size=8, prefix_cache=None):
+        self.processor = processor
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.prefix_cache = prefix_cache
+        self.stops = CallStops(getattr(processor, "tokenizer", processor), model)
+
+        self.pending = queue.Queue()
+        self.active = []
+        self.layers = None  # per-layer (keys, values), batch-major and left-padded
+        self.mask = None
+
+        self.thread = threading.Thread(target=self._loop, name="continuous-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, input_ids, max_new_tokens=128, max_calls=1):
+        """Queue a prompt (list of token ids); the future resolves to the generated ids"""
+        future = Future()
+        self.pending.put(_Sequence(list(input_ids), max_new_tokens, max_calls, future))
+        return future
+
+    def _loop(self):
+        with torch.inference_mode():
+            while True:
+                # Block only when there is nothing to decode
+                if not self.active:
+                    self._admit(self.pending.get())
+                while len(self.active) < self.max_batch_size:
+                    try:
+                        self._admit(self.pending.get_nowait())
+                    except queue.Empty:
+                        break
+                # Sequences can finish on their very first token
+                self._retire()
+                if self.active:
+                    self._step()
+
+    def _admit(self, seq):
+        """Prefill a new sequence on its own and merge its cache into the batch"""
+        past_key_values, cached = None, 0
+        if self.prefix_cache:
+            past_key_values, cached = self.prefix_cache.match(seq.input_ids)
+        if past_key_values is None:
+            # Full-length layers everywhere so all layers pad and trim alike
+            past_key_values = DynamicCache()
+        try:
+            ids = torch.tensor([seq.input_ids[cached:]], device=self.model.device)
+            out = self.model(input_ids=ids, past_key_values=past_key_values, use_cache=True)
+        except Exception as e:
+            seq.future.set_exception(e)
+            return
+
+        layers = self._to_layers(out.past_key_values)
+        mask = torch.ones((1, len(seq.input_ids)), dtype=torch.long, device=ids.device)
+
+        if self.active:
+            length = max(self.mask.shape[1], mask.shape[1])
+            self.layers, self.mask = _left_pad(self.layers, self.mask, length)
+            layers, mask = _left_pad(layers, mask, length)
+            self.layers = [
+                (torch.cat([k1, k2]), torch.cat([v1, v2]))
+                for (k1, v1), (k2, v2) in zip(self.layers, layers)
+            ]
+            self.mask = torch.cat([self.mask, mask])
+        else:
+            self.layers, self.mask = layers, mask
+
+        self.active.append(seq)
+        self._emit(len(self.active) - 1, int(out.logits[0, -1].argmax()))
+
+    def _step(self):
+        """Decode one token for every active sequence in a single forward pass"""
+        device = self.mask.device
+        tokens = torch.tensor([[seq.generated[-1]] for seq in self.active], device=device)
+        positions = torch.tensor([[seq.length] for seq in self.active], device=device)
+        self.mask = torch.cat([self.mask, self.mask.new_ones((len(self.active), 1))], dim=1)
+
+        try:
+            out = self.model(
+                input_ids=tokens,
+                attention_mask=self.mask,
+                position_ids=positions,
+                past_key_values=DynamicCache(self.layers),
+                use_cache=True
+            )
+        except Exception as e:
+            for seq in self.active:
+                seq.future.set_exception(e)
+            self.active, self.layers, self.mask = [], None, None
+            return
+
+        self.layers = self._to_layers(out.past_key_values)
+        next_tokens = out.logits[:, -1].argmax(dim=-1).tolist()
+        for index, seq in enumerate(self.active):
+            seq.length += 1
+            self._emit(index, next_tokens[index])
+        self._retire()
+
+    def _emit(self, index, token):
+        seq = self.active[index]
+        seq.generated.append(token)
+        seq.done = self.stops.done(seq.generated, seq.max_new_tokens, seq.max_calls)
+
+    def _retire(self):
+        """Drop finished sequences from the batch and trim shared left padding"""
+        keep = [i for i, seq in enumerate(self.active) if not seq.done]
+        for seq in self.active:
+            if seq.done:
+                seq.future.set_result(seq.generated)
+        if len(keep) == len(self.active):
+            return
+        if not keep:
+            self.active, self.layers, self.mask = [], None, None
+            return
+
+        index = torch.tensor(keep, device=self.mask.device)
+        self.active = [self.active[i] for i in keep]
+        self.mask = self.mask.index_select(0, index)
+        # Columns that are padding for every remaining sequence can go
+        start = int((self.mask.sum(dim=0) > 0).nonzero()[0])
+        self.mask = self.mask[:, start:]
+        self.layers = [
+            (k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+            for k, v in self.layers
+        ]
+
+    @staticmethod
+    def _to_layers(cache):
+        if hasattr(cache, "layers"):
+            return [(layer.keys, layer.values) for layer in cache.layers]
+        return [(k, v) for k, v in cache.to_legacy_cache()]
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def benchmark(engine, prompts, clients, max_new_tokens=None):
+    """Run prompts from concurrent client threads and return throughput/latency numbers"""
+    latencies = []
+    work = queue.Queue()
+    for prompt in prompts:
+        work.put(prompt)
+
+    def client():
+        while True:
+            try:
+                messages, tools = work.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            engine.generate(messages, tools, max_new_tokens=max_new_tokens)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99)
+    }
+
+def main():
+    import argparse
+    from engine import DEVELOPER_PROMPT, WARM_UP_TOOLS, Engine
+    from loader import load_model
+
+    parser = argparse.ArgumentParser(description="Sequential vs continuous batching benchmark")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="Defaults to the budget derived from the tool schemas")
+    args = parser.parse_args()
+
+    utterances = ["Set volume to 50", "Set volume to 10", "Mute the volume", "Volume at 75 please"]
+    prompts = [
+        ([{"role": "developer", "content": DEVELOPER_PROMPT},
+          {"role": "user", "content": utterances[i % len(utterances)]}], WARM_UP_TOOLS)
+        for i in range(args.requests)
+    ]
+
+    processor, model = load_model()
+    for name, engine in [
+        ("sequential", Engine(processor, model)),
+        ("continuous", Engine(processor, model, batch_size=args.batch_size))
+    ]:
+        engine.warm_up()
+        stats = benchmark(engine, prompts, args.clients, args.max_new_tokens)
+        print(f"{name:>10}: {stats['throughput']:.2f} req/s  "
+              f"p50 {stats['p50'] * 1000:.0f} ms  p95 {stats['p95'] * 1000:.0f} ms  "
+              f"({stats['requests']} requests in {stats['elapsed']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
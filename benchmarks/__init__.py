@@ -0,0 +1,10 @@
+"""
+End-to-end benchmarks that run without the gated FunctionGemma weights.
+
+standin.py builds a small randomly initialised Gemma3 model and a tokenizer
+with FunctionGemma's control tokens and chat template shape, so every stage
+of a request can be timed offline on any machine:
+
+    python -m benchmarks                          # table + benchmarks/results/<commit>.json
+    python -m benchmarks --baseline old.json      # also show the change against a previous run
+"""
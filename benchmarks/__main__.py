@@ -0,0 +1,224 @@
+"""
+Per-stage and end-to-end benchmark on the offline stand-in model.
+
+Stages are timed separately (chat-template rendering, tokenization, prefill,
+per-token decode, call parsing, dispatch), then whole requests go through an
+Engine from 1..N concurrent clients. Results are written as JSON, keyed by
+commit, so runs from different commits can be compared with --baseline.
+
+    python -m benchmarks
+    python -m benchmarks --size tiny --levels 1 2 --output quick.json
+    python -m benchmarks --baseline benchmarks/results/<commit>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+import torch
+import transformers
+from transformers import DynamicCache
+
+from batching import benchmark
+from benchmarks import standin
+from engine import DEVELOPER_PROMPT, Engine
+from functions import registry
+from parsing import extract_tool_calls, format_call
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+UTTERANCES = [
+    "Turn WiFi on", "Turn WiFi off", "Set volume to 50", "Mute the volume",
+    "Open notepad", "Open Chrome browser", "Volume at 75 please", "Launch the calculator"
+]
+
+# Parser inputs: single calls, several calls in one output, and a long escaped string
+OUTPUTS = [
+    format_call({"name": "set_volume", "arguments": {"level": 50}}),
+    format_call({"name": "open_app", "arguments": {"app_name": "notepad"}}),
+    "".join(format_call({"name": "toggle_wifi", "arguments": {"state": s}}) for s in ("on", "off", "on")),
+    format_call({"name": "open_app", "arguments": {"app_name": "a, b} c " * 200}})
+]
+
+CALLS = [
+    {"name": "set_volume", "arguments": {"level": 50}},
+    {"name": "toggle_wifi", "arguments": {"state": "on"}},
+    {"name": "open_app", "arguments": {"app_name": "notepad"}}
+]
+
+def summarize(latencies, work=None):
+    """p50/p95/p99/mean in ms, plus work units (tokens, calls) per second if given"""
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    result = {
+        "n": len(latencies),
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000
+    }
+    if work is not None:
+        result["per_second"] = work / sum(latencies)
+    return result
+
+def _timed(fn, items, repeat):
+    """Latencies of fn(item) over items round-robin, repeat calls in total"""
+    latencies = []
+    for i in range(repeat):
+        item = items[i % len(items)]
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+@torch.no_grad()
+def stage_latencies(tokenizer, model, prompts, repeat, decode_tokens):
+    """Latency summaries of each request stage"""
+    stages = {}
+    texts = [tokenizer.apply_chat_template(m, tools=t, add_generation_prompt=True, tokenize=False) for m, t in prompts]
+    ids = [tokenizer(text, add_special_tokens=False)["input_ids"] for text in texts]
+
+    def render(prompt):
+        tokenizer.apply_chat_template(prompt[0], tools=prompt[1], add_generation_prompt=True, tokenize=False)
+
+    stages["render"] = summarize(_timed(render, prompts, repeat))
+    stages["tokenize"] = summarize(_timed(lambda t: tokenizer(t, add_special_tokens=False), texts, repeat))
+
+    prefill_repeat = max(3, repeat // 10)
+    prefill = _timed(lambda i: model(input_ids=torch.tensor([i], device=model.device)), ids, prefill_repeat)
+    prompt_tokens = statistics.fmean(len(i) for i in ids)
+    stages["prefill"] = summarize(prefill, work=prompt_tokens * prefill_repeat)
+    stages["prefill"]["prompt_tokens"] = prompt_tokens
+
+    # One token per step into a growing cache, after a real prefill
+    steps = []
+    for prompt in ids[:max(1, prefill_repeat // 2)]:
+        cache = DynamicCache()
+        token = model(input_ids=torch.tensor([prompt], device=model.device), past_key_values=cache,
+                      use_cache=True).logits[:, -1:].argmax(-1)
+        for _ in range(decode_tokens):
+            start = time.perf_counter()
+            token = model(input_ids=token, past_key_values=cache, use_cache=True).logits[:, -1:].argmax(-1)
+            steps.append(time.perf_counter() - start)
+    stages["decode"] = summarize(steps, work=len(steps))
+
+    stages["parse"] = summarize(_timed(extract_tool_calls, OUTPUTS, repeat))
+    stages["dispatch"] = summarize(_timed(registry.dispatch, CALLS, repeat))
+    return stages
+
+def end_to_end(tokenizer, model, prompts, levels, requests, max_new_tokens, batch_size):
+    """Throughput and latency of whole requests through an Engine at each concurrency level"""
+    engine = Engine(tokenizer, model, batch_size=batch_size)
+    engine.warm_up()
+    results = []
+    for clients in levels:
+        work = [prompts[i % len(prompts)] for i in range(max(requests, clients))]
+        stats = benchmark(engine, work, clients, max_new_tokens)
+        results.append({
+            "clients": clients,
+            "requests": stats["requests"],
+            "throughput": stats["throughput"],
+            "p50_ms": stats["p50"] * 1000,
+            "p95_ms": stats["p95"] * 1000,
+            "p99_ms": stats["p99"] * 1000
+        })
+    return results
+
+def _commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _change(new, old):
+    return f"{(new - old) / old:+.0%}" if old else "-"
+
+def print_report(results, baseline=None):
+    base_stages = baseline["stages"] if baseline else {}
+    print(f"\n{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}" + ("  vs baseline p50" if baseline else ""))
+    for name, s in results["stages"].items():
+        line = f"{name:<10}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}"
+        line += f"{s['per_second']:>12.1f}" if "per_second" in s else f"{'':>12}"
+        if name in base_stages:
+            line += f"  {_change(s['p50_ms'], base_stages[name]['p50_ms'])}"
+        print(line)
+
+    base_levels = {r["clients"]: r for r in baseline["end_to_end"]} if baseline else {}
+    print(f"\n{'clients':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" + ("  vs baseline req/s" if baseline else ""))
+    for r in results["end_to_end"]:
+        line = f"{r['clients']:<10}{r['throughput']:>10.2f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        if r["clients"] in base_levels:
+            line += f"  {_change(r['throughput'], base_levels[r['clients']]['throughput'])}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every request stage on an offline stand-in model")
+    parser.add_argument("--size", choices=sorted(standin.SIZES), default="small")
+    parser.add_argument("--repeat", type=int, default=200, help="Samples per cheap stage (prefill uses a tenth)")
+    parser.add_argument("--decode-tokens", type=int, default=32, help="Decode steps timed per prompt")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--max-new-tokens", type=int, default=32,
+                        help="Fixed per request (the random model rarely stops on its own)")
+    parser.add_argument("--batch-size", type=int, default=0, help="Continuous batching in the end-to-end runs")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (default: torch's choice)")
+    parser.add_argument("--output", help="JSON file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tools = registry.schemas()
+    prompts = [([{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": u}], tools)
+               for u in UTTERANCES]
+
+    print(f"Building {args.size} stand-in model...")
+    tokenizer, model = standin.build(tools, UTTERANCES, size=args.size)
+
+    print("Timing stages...")
+    stages = stage_latencies(tokenizer, model, prompts, args.repeat, args.decode_tokens)
+    print("Timing end-to-end requests...")
+    e2e = end_to_end(tokenizer, model, prompts, args.levels, args.requests, args.max_new_tokens, args.batch_size)
+
+    results = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "machine": platform.machine(),
+            "threads": torch.get_num_threads()
+        },
+        "config": {
+            "size": args.size,
+            "parameters": sum(p.numel() for p in model.parameters()),
+            "max_new_tokens": args.max_new_tokens,
+            "batch_size": args.batch_size
+        },
+        "stages": stages,
+        "end_to_end": e2e
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Side-by-side timing of decode loops on the real model.
+
+speculative.py and restricted.py run their decoders against plain greedy
+generate() through compare(): each prompt is rendered and budgeted once,
+every mode decodes it `repeat` times and the fastest run is kept.
+"""
+
+import time
+
+import torch
+
+from engine import DEVELOPER_PROMPT, Engine
+from loader import load_model
+from quantize_check import REFERENCE_PROMPTS
+from schemas import FUNCTIONS
+from stopping import stopping_criteria, token_budget
+
+# Argument values copied from the command, on top of the reference set
+COPYING_PROMPTS = [
+    "Type Hello World, this is a test of the keyboard", "Search for Python tutorials for beginners",
+    "Type The quick brown fox jumps over the lazy dog"
+]
+PROMPTS = REFERENCE_PROMPTS + COPYING_PROMPTS
+
+def load_engine():
+    """Load the model into a warmed-up Engine without a prefix cache, so every prompt is prefilled"""
+    print("Loading model...")
+    processor, model = load_model()
+    engine = Engine(processor, model, prefix_cache=False)
+    engine.warm_up()
+    return engine
+
+def greedy(engine):
+    """Mode decoding with the model's own generate(), the output every decoder is checked against"""
+    model = engine.model
+
+    def run(messages, input_ids, max_new_tokens):
+        ids = torch.tensor([input_ids], device=model.device)
+        return model.generate(
+            input_ids=ids, attention_mask=torch.ones_like(ids), do_sample=False,
+            pad_token_id=engine.processor.eos_token_id, max_new_tokens=max_new_tokens,
+            stopping_criteria=stopping_criteria(engine.tokenizer, len(input_ids))
+        )[0][len(input_ids):].tolist()
+
+    return run
+
+def compare(engine, modes, prompts=PROMPTS, repeat=3, tools=FUNCTIONS):
+    """Yield (prompt, {mode: generated ids}, {mode: fastest seconds}) for each prompt
+
+    modes maps a name to run(messages, input_ids, max_new_tokens), which
+    returns the generated ids.
+    """
+    for prompt in prompts:
+        messages = [{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": prompt}]
+        input_ids = engine.renderer.render(messages, tools)
+        max_new_tokens = token_budget(engine.tokenizer, tools, messages=messages)
+        outputs, timings = {}, {}
+        for mode, run in modes.items():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                outputs[mode] = run(messages, input_ids, max_new_tokens)
+                elapsed = time.perf_counter() - start
+                timings[mode] = min(timings.get(mode, elapsed), elapsed)
+        yield prompt, outputs, timings
+
+def report(results):
+    """Print per-mode latency and throughput for the (prompt, outputs, timings) compare() yielded"""
+    for mode in results[0][1]:
+        tokens = sum(len(outputs[mode]) for _, outputs, _ in results)
+        seconds = sum(timings[mode] for _, _, timings in results)
+        print(f"{mode:<12} {seconds / len(results) * 1000:8.1f} ms per request {tokens / seconds:8.1f} tokens/s")
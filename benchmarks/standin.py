@@ -0,0 +1,99 @@
+"""
+Offline stand-in for FunctionGemma: a BPE tokenizer trained on the tool
+schemas and sample commands, plus a randomly initialised Gemma3 model.
+
+The outputs are meaningless, but the shapes are right: prompts tokenize to a
+similar length, the model has Gemma3's mixed sliding/full attention layers,
+and the control tokens (<start_function_call>, <escape>, ...) are single
+tokens, so rendering, prefill, decoding and the engine's stopping logic all
+do the same work they do on the real model, at a size set by SIZES.
+
+The tokenizer's own vocabulary is a few thousand tokens. The "small" size
+pads the embedding and output head to Gemma's 262,144 rows, since on the
+270M model the output projection costs about as much per token as the
+transformer layers; the extra rows are never produced by the tokenizer.
+"""
+
+import json
+
+import torch
+
+SPECIAL_TOKENS = ["<pad>", "<eos>", "<bos>", "<unk>", "<start_of_turn>", "<end_of_turn>"]
+CONTROL_TOKENS = [
+    "<start_function_call>", "<end_function_call>", "<start_function_response>",
+    "<end_function_response>", "<escape>", "<start_function_declaration>", "<end_function_declaration>"
+]
+
+# Same structure as FunctionGemma's template: tool declarations in the first
+# turn, calls and responses wrapped in control tokens
+CHAT_TEMPLATE = """{{ bos_token }}{% for message in messages %}<start_of_turn>{{ message['role'] }}
+{% if message['content'] is string %}{{ message['content'] }}{% elif message['content'] %}{{ message['content'] | tojson }}{% endif %}\
+{% if loop.first and tools %}{% for tool in tools %}<start_function_declaration>{{ tool | tojson }}<end_function_declaration>{% endfor %}{% endif %}\
+{% if message['tool_calls'] %}{% for call in message['tool_calls'] %}<start_function_call>call:{{ call['function']['name'] }}{{ call['function']['arguments'] | tojson }}<end_function_call>{% endfor %}{% endif %}<end_of_turn>
+{% endfor %}{% if add_generation_prompt %}<start_of_turn>model
+{% endif %}"""
+
+GEMMA_VOCAB_SIZE = 262144
+
+SIZES = {
+    # Fast enough for a smoke run
+    "tiny": dict(hidden_size=64, intermediate_size=256, num_hidden_layers=4, num_attention_heads=2,
+                 num_key_value_heads=1, head_dim=32),
+    # Per-token cost in the same range as the 270M model on CPU, output head included
+    "small": dict(hidden_size=640, intermediate_size=2048, num_hidden_layers=18, num_attention_heads=4,
+                  num_key_value_heads=1, head_dim=256, vocab_size=GEMMA_VOCAB_SIZE)
+}
+
+def build_tokenizer(corpus, vocab_size=4096):
+    """BPE tokenizer trained on corpus, with FunctionGemma's special and control tokens"""
+    from tokenizers import AddedToken, Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Sequence([
+        pre_tokenizers.Digits(individual_digits=True),
+        pre_tokenizers.ByteLevel(add_prefix_space=False)
+    ])
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    ))
+    tokenizer.add_tokens([AddedToken(t, special=False, normalized=False) for t in CONTROL_TOKENS])
+
+    fast = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<bos>", eos_token="<eos>", pad_token="<pad>",
+        unk_token="<unk>", additional_special_tokens=SPECIAL_TOKENS[4:]
+    )
+    fast.chat_template = CHAT_TEMPLATE
+    return fast
+
+def build_model(tokenizer, size="small", seed=0):
+    """Randomly initialised Gemma3 causal LM with at least the tokenizer's vocabulary"""
+    from transformers import Gemma3ForCausalLM, Gemma3TextConfig
+
+    params = dict(SIZES[size])
+    layers = params["num_hidden_layers"]
+    config = Gemma3TextConfig(
+        vocab_size=max(len(tokenizer), params.pop("vocab_size", 0)),
+        max_position_embeddings=4096,
+        sliding_window=512,
+        # Gemma3's pattern: five sliding-window layers, then one global one
+        layer_types=["full_attention" if (i + 1) % 6 == 0 else "sliding_attention" for i in range(layers)],
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        **params
+    )
+    torch.manual_seed(seed)
+    model = Gemma3ForCausalLM(config).eval()
+    model.generation_config.eos_token_id = tokenizer.eos_token_id
+    model.generation_config.pad_token_id = tokenizer.pad_token_id
+    return model
+
+def build(tools, utterances, size="small", seed=0):
+    """(tokenizer, model) stand-in pair; the tokenizer is trained on the tools and utterances"""
+    corpus = [json.dumps(tool) for tool in tools] + list(utterances)
+    corpus += [f"call:{tool['function']['name']}" for tool in tools]
+    tokenizer = build_tokenizer(corpus * 10)
+    return tokenizer, build_model(tokenizer, size, seed)
@@ -0,0 +1,196 @@
+"""
+Bulk inference over a JSONL file of requests.
+
+Each input line is {"utterance": "..."} or {"messages": [...]}, optionally
+with an "id", "tools" (tool names, default: all) and "max_calls". Results are
+written to the output JSONL in input order:
+
+    {"line": 0, "id": ..., "utterance": ..., "response": "...", "calls": [...], "elapsed": 0.41}
+
+and a line that can't be processed gets {"line", "id", "error"} instead.
+
+The input is read lazily and at most --window requests are in flight, so
+memory stays flat however long the file is. Requests run concurrently through
+a continuous-batching Engine (or a running server with --server). Progress is
+checkpointed next to the output (<output>.checkpoint: input lines done and
+output bytes written); rerunning the same command truncates the output back
+to the last checkpoint and carries on from there.
+
+    python bulk.py utterances.jsonl results.jsonl
+    python bulk.py utterances.jsonl results.jsonl --batch-size 16 --window 64
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import DEVELOPER_PROMPT
+
+def read_requests(path, start=0):
+    """(line number, parsed request or the parse error) for each non-blank line from start"""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if number < start or not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+
+def to_messages(request):
+    """Chat messages for a request line"""
+    if "messages" in request:
+        messages = list(request["messages"])
+        if not messages:
+            raise ValueError("'messages' is empty")
+        if messages[0]["role"] not in ("developer", "system"):
+            messages.insert(0, {"role": "developer", "content": DEVELOPER_PROMPT})
+        return messages
+    utterance = request.get("utterance") or request.get("text") or request.get("content")
+    if not utterance:
+        raise ValueError("expected 'utterance' or 'messages'")
+    return [{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": utterance}]
+
+def process(backend, registry, number, request):
+    """Output record for one input line"""
+    if isinstance(request, Exception):
+        return {"line": number, "error": f"Invalid JSON: {request}"}
+    if not isinstance(request, dict):
+        return {"line": number, "error": "Invalid input: expected a JSON object"}
+    record = {"line": number, "id": request.get("id")}
+    if "utterance" in request:
+        record["utterance"] = request["utterance"]
+    names = request.get("tools")
+    if names is not None and not (isinstance(names, list) and all(isinstance(n, str) for n in names)):
+        record["error"] = "Invalid input: 'tools' must be a list of tool names"
+        return record
+    unknown = [name for name in names or () if name not in registry]
+    if unknown:
+        record["error"] = f"Unknown tool: {unknown[0]}"
+        return record
+    try:
+        messages = to_messages(request)
+    except KeyError as e:
+        record["error"] = f"Invalid input: missing {e}"
+        return record
+    except (TypeError, ValueError, IndexError, AttributeError) as e:
+        record["error"] = f"Invalid input: {e}"
+        return record
+    try:
+        result = backend.complete(messages, registry.schemas(names), max_calls=request.get("max_calls", 1))
+    except Exception as e:
+        record["error"] = str(e)
+        return record
+    record.update(response=result["response"], calls=result["calls"], elapsed=result["elapsed"])
+    return record
+
+class Checkpoint:
+    """Input lines done and output bytes written, replaced atomically"""
+
+    def __init__(self, output, input_path):
+        self.path = output + ".checkpoint"
+        self.input = os.path.abspath(input_path)
+
+    def load(self):
+        """(next input line, output bytes, done) to resume from"""
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("input") == self.input:
+                return state["next_line"], state["output_bytes"], state.get("done", False)
+            print(f"Ignoring {self.path}: it was written for {state.get('input')}")
+        return 0, 0, False
+
+    def save(self, output_file, next_line, done=False):
+        # The output must be on disk before the checkpoint that points past it
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        state = {"input": self.input, "next_line": next_line, "output_bytes": output_file.tell(), "done": done}
+        partial = self.path + ".partial"
+        with open(partial, "w") as f:
+            json.dump(state, f)
+        os.replace(partial, self.path)
+
+def run(backend, registry, input_path, output_path, workers=8, window=32, checkpoint_every=16):
+    """Process input_path into output_path, resuming from its checkpoint; returns (lines, errors)"""
+    checkpoint = Checkpoint(output_path, input_path)
+    start, output_bytes, done = checkpoint.load()
+    if (start or done) and (not os.path.exists(output_path) or os.path.getsize(output_path) < output_bytes):
+        # The results the checkpoint points past are gone; redo everything
+        print(f"Ignoring {checkpoint.path}: {output_path} is missing or shorter than it records")
+        start, output_bytes, done = 0, 0, False
+    if done:
+        print(f"{output_path} is already complete")
+        return 0, 0
+    if start:
+        print(f"Resuming at input line {start}")
+
+    mode = "r+b" if start else "wb"
+    processed = errors = 0
+    started = time.perf_counter()
+    with open(output_path, mode) as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        # Anything written after the last checkpoint is redone
+        out.truncate(output_bytes if mode == "r+b" else 0)
+        out.seek(0, os.SEEK_END)
+        in_flight = deque()  # (line number, future), in input order
+        next_line = start
+
+        def write_oldest():
+            nonlocal next_line, processed, errors
+            number, future = in_flight.popleft()
+            record = future.result()
+            out.write(json.dumps(record).encode("utf-8") + b"\n")
+            next_line = number + 1
+            processed += 1
+            errors += "error" in record
+            if processed % checkpoint_every == 0:
+                checkpoint.save(out, next_line)
+                rate = processed / (time.perf_counter() - started)
+                print(f"{processed} lines ({rate:.1f}/s), {errors} errors")
+
+        for number, request in read_requests(input_path, start):
+            in_flight.append((number, pool.submit(process, backend, registry, number, request)))
+            if len(in_flight) >= window:
+                write_oldest()
+        while in_flight:
+            write_oldest()
+        checkpoint.save(out, next_line, done=True)
+    return processed, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requests through the model")
+    parser.add_argument("input", help="JSONL with one request per line")
+    parser.add_argument("output", help="JSONL results (resumed if a checkpoint exists)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Sequences decoded together")
+    parser.add_argument("--window", type=int, default=32, help="Max requests in flight (bounds memory)")
+    parser.add_argument("--checkpoint-every", type=int, default=16, help="Lines between checkpoints")
+    parser.add_argument("--actions", action="store_true", help="Use the desktop action tools instead of functions.py")
+    parser.add_argument("--server", help="Send requests to this running server instead of loading the model")
+    args = parser.parse_args()
+
+    if args.actions:
+        from actions import registry
+    else:
+        from functions import registry
+
+    if args.server:
+        from client import Client
+        backend = Client(args.server)
+    else:
+        from engine import Engine
+        from loader import load_model
+        from retrieval import ToolRetriever
+        print("Loading model...")
+        backend = Engine(*load_model(), batch_size=args.batch_size, retriever=ToolRetriever())
+
+    processed, errors = run(
+        backend, registry, args.input, args.output,
+        workers=args.batch_size, window=max(args.window, args.batch_size), checkpoint_every=args.checkpoint_every
+    )
+    print(f"Done: {processed} lines this run, {errors} errors -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Thin client for the resident model server (see server.py).
+
+Entry points call connect() and use the returned backend's complete(). When
+no server is running the model is loaded in-process instead, so the scripts
+keep working on their own.
+
+Set FUNCTIONGEMMA_SERVER to "http://host:port" or "unix:/path/to.sock" to
+point at a server other than the default http://127.0.0.1:8765.
+
+Nothing heavy is imported here: torch and transformers are only imported
+when a local Engine is actually needed, optionally on a background thread.
+"""
+
+import http.client
+import json
+import os
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import startup
+
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class Client:
+    """Sends completion requests to a running server.py"""
+
+    def __init__(self, address=None, timeout=120):
+        self.address = address or os.environ.get("FUNCTIONGEMMA_SERVER", DEFAULT_SERVER)
+        self.timeout = timeout
+
+    def _connection(self, timeout):
+        if self.address.startswith("unix:"):
+            return UnixHTTPConnection(self.address[len("unix:"):], timeout=timeout)
+        url = urlsplit(self.address)
+        return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+    def _request(self, method, path, payload=None, timeout=None):
+        conn = self._connection(timeout or self.timeout)
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"Server error {response.status}: {data.get('error')}")
+        return data
+
+    def available(self):
+        """Return True if a server is listening at the configured address"""
+        try:
+            return self._request("GET", "/health", timeout=1).get("status") == "ok"
+        except (OSError, ValueError, RuntimeError):
+            return False
+
+    def complete(self, messages, tools, max_new_tokens=None, session=None, max_calls=1):
+        """Return {"response", "calls", "elapsed"} for the messages"""
+        return self._request("POST", "/generate", {
+            "messages": messages,
+            "tools": tools,
+            "max_new_tokens": max_new_tokens,
+            "max_calls": max_calls,
+            "session": session
+        })
+
+    def stream(self, messages, tools, max_new_tokens=None, session=None, max_calls=1):
+        """Yield {"call": ...} events as the server parses them, then the final result"""
+        conn = self._connection(self.timeout)
+        try:
+            conn.request("POST", "/generate_stream", body=json.dumps({
+                "messages": messages,
+                "tools": tools,
+                "max_new_tokens": max_new_tokens,
+                "max_calls": max_calls,
+                "session": session
+            }), headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            if response.status != 200:
+                data = json.loads(response.read() or b"{}")
+                raise RuntimeError(f"Server error {response.status}: {data.get('error')}")
+            for line in response:
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(f"Server error: {event['error']}")
+                yield event
+        finally:
+            conn.close()
+
+    def end_session(self, session):
+        """Tell the server a conversation is finished so it can free its cache"""
+        self._request("POST", "/end_session", {"session": session})
+
+class BackgroundEngine:
+    """Loads a local Engine on a background thread; the first call waits for it"""
+
+    def __init__(self):
+        self._engine = None
+        self._error = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._load, name="model-loader", daemon=True).start()
+
+    def _load(self):
+        try:
+            self._engine = _local_engine()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def __getattr__(self, name):
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return getattr(self._engine, name)
+
+def _local_engine():
+    from engine import Engine
+    from loader import load_model
+    from response_cache import ResponseCache
+    from retrieval import ToolRetriever
+    from router import IntentRouter
+
+    engine = Engine(
+        *load_model(), response_cache=ResponseCache(), router=IntentRouter(), retriever=ToolRetriever()
+    )
+    startup.mark("model loaded")
+    return engine
+
+def connect(address=None, background=False):
+    """Return the resident server client if one is running, else a local Engine
+
+    With background=True the local model loads on a thread and connect()
+    returns at once; the first call on the backend waits for the load.
+    """
+    client = Client(address)
+    if client.available():
+        print(f"Using model server at {client.address}")
+        return client
+
+    if background:
+        print("Loading model in the background...")
+        return BackgroundEngine()
+    print("Loading model...")
+    return _local_engine()
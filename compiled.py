@@ -0,0 +1,117 @@
+"""
+Compiled decoding backend.
+
+Eager decoding of a 270M model is dominated by Python and kernel-launch
+overhead rather than arithmetic. CompiledBackend decodes into a StaticCache
+(fixed-shape KV buffers, reused across requests) and runs the one-token
+decode step through torch.compile, so each step is a single fused graph.
+
+Cache sizes are bucketed: a request uses the smallest bucket that holds its
+prompt plus max_new_tokens, so only a handful of shapes ever get compiled,
+and warm_up() compiles all of them once at startup. Inductor's compiled
+artifacts are kept in COMPILE_CACHE_DIR so a restart loads them instead of
+recompiling. The prompt itself is prefilled eagerly (one large forward pass
+gains little from compilation). Decoding is greedy.
+"""
+
+import os
+import threading
+
+import torch
+from transformers import StaticCache
+
+from stopping import MAX_BUDGET, CallStops, DecodeLoop
+
+COMPILE_CACHE_DIR = "./local_models/compile_cache"
+# Total cache lengths (prompt + generated tokens)
+BUCKETS = (256, 512, 1024, 2048)
+
+def _decode_step(model, token, position, cache):
+    # The cache is an argument, not a global, so its position counter is
+    # treated as dynamic after the first recompile instead of guarded per value
+    return model(input_ids=token, position_ids=position, past_key_values=cache, use_cache=True).logits[:, -1]
+
+class CompiledBackend:
+    """Static-cache decoding with a torch.compile'd single-token step"""
+
+    def __init__(self, processor, model, buckets=BUCKETS, cache_dir=COMPILE_CACHE_DIR):
+        # Must be set before the first compilation; torch may already have
+        # filled in its default (a temp dir) while the model was loading
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.abspath(cache_dir)
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        self.buckets = sorted(buckets)
+        self.caches = {}  # bucket -> StaticCache
+        self.lock = threading.Lock()
+
+        # A few graphs per bucket (sliding-window layers recompile once they fill up)
+        limit = 8 * len(self.buckets)
+        if hasattr(torch._dynamo.config, "recompile_limit"):
+            torch._dynamo.config.recompile_limit = max(torch._dynamo.config.recompile_limit, limit)
+        else:
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, limit)
+        # CUDA graphs cut launch overhead further; there is nothing to capture on CPU
+        mode = "reduce-overhead" if model.device.type == "cuda" else None
+        self.step = torch.compile(_decode_step, fullgraph=True, mode=mode)
+
+        self.stops = CallStops(self.tokenizer, model)
+
+    def bucket(self, total_length):
+        """Smallest bucket holding total_length tokens, or None if none does"""
+        return next((b for b in self.buckets if b >= total_length), None)
+
+    def _cache(self, bucket):
+        if bucket not in self.caches:
+            # Buffers are allocated on the first prefill, on the model's device and dtype
+            self.caches[bucket] = StaticCache(config=self.model.config, max_cache_len=bucket)
+        cache = self.caches[bucket]
+        cache.reset()
+        return cache
+
+    def _prefill(self, input_ids, cache):
+        device = self.model.device
+        return self.model(
+            input_ids=torch.tensor([input_ids], device=device),
+            position_ids=torch.arange(len(input_ids), device=device).unsqueeze(0),
+            past_key_values=cache, use_cache=True
+        ).logits[:, -1]
+
+    @torch.no_grad()
+    def generate(self, input_ids, max_new_tokens=MAX_BUDGET, max_calls=1, streamer=None):
+        """Decode a prompt (list of token ids) and return the generated ids, or None if it fits no bucket"""
+        length = len(input_ids)
+        bucket = self.bucket(length + max_new_tokens)
+        if bucket is None:
+            return None
+
+        device = self.model.device
+        with self.lock:
+            loop = DecodeLoop(self.stops, input_ids, max_new_tokens, max_calls, streamer)
+            cache = self._cache(bucket)
+            token = self._prefill(input_ids, cache).argmax(-1)
+            for i in range(max_new_tokens):
+                if loop.emit([int(token)]):  # waits for the device
+                    break
+                position = torch.tensor([[length + i]], device=device)
+                token = self.step(self.model, token.view(1, 1), position, cache).argmax(-1)
+
+        return loop.finish()
+
+    @torch.no_grad()
+    def warm_up(self, steps=3):
+        """Compile the decode step for every bucket (loaded from the on-disk cache after the first run)"""
+        filler = self.tokenizer.pad_token_id or 0
+        device = self.model.device
+        with self.lock:
+            for bucket in self.buckets:
+                # A prompt near the end of the bucket also covers full sliding-window layers
+                for length in (4, bucket - steps):
+                    cache = self._cache(bucket)
+                    token = self._prefill([filler] * length, cache).argmax(-1)
+                    for i in range(steps):
+                        position = torch.tensor([[length + i]], device=device)
+                        token = self.step(self.model, token.view(1, 1), position, cache).argmax(-1)
@@ -0,0 +1,293 @@
+"""
+Grammar-constrained decoding for function calls.
+
+The active tool list is compiled into a token-level automaton (CallGrammar):
+tool names, argument names and enum values become tries of token ids, integer
+and number values are limited to digit tokens, and strings run freely until
+the closing <escape>. ConstrainedDecoder runs a greedy loop that masks every
+logit the grammar does not allow and, wherever only one token is legal
+(call:, braces, argument names, <escape> markers, the tail of a tool name),
+appends it without a forward pass. Forced tokens are fed to the model together
+with the next real decode step.
+
+Every completion that fits in max_new_tokens is a well-formed call; hitting
+the budget ends decoding where it is, as in unconstrained generation. String
+values run until the model closes them or the budget runs out; a string cut
+off by the budget is left open, so the output doesn't parse as a call and the
+loss isn't hidden. The
+model cannot answer in plain text in this mode. Array and object parameters
+have no grammar here, so tool sets that use them are decoded unconstrained
+(see supports()).
+"""
+
+import json
+
+import torch
+
+import metrics
+from stopping import END_CALL, MAX_BUDGET, START_CALL, eos_token_ids
+
+ESCAPE = "<escape>"
+# Cap on number values so a confused model can't run away; strings are
+# bounded by the token budget
+MAX_NUMBER_TOKENS = 12
+# Parameter types the grammar can express (anything with an enum is fine too)
+SUPPORTED_TYPES = ("string", "integer", "number", "boolean")
+
+class _OutOfBudget(Exception):
+    """max_new_tokens reached"""
+
+def supports(tools):
+    """True if every parameter of every tool can be expressed by a CallGrammar"""
+    for tool in tools:
+        function = tool.get("function", tool)
+        for schema in function.get("parameters", {}).get("properties", {}).values():
+            if "enum" not in schema and schema.get("type", "string") not in SUPPORTED_TYPES:
+                return False
+    return True
+
+class _Trie:
+    """Token-id trie over a set of labelled alternatives"""
+
+    def __init__(self, alternatives):
+        self.root = {}
+        for label, ids in alternatives.items():
+            node = self.root
+            for token in ids:
+                node = node.setdefault(token, {})
+            node[None] = label
+
+class CallGrammar:
+    """Token-level description of every call the given tools allow"""
+
+    def __init__(self, tokenizer, tools):
+        self.tokenizer = tokenizer
+        self.start = tokenizer.convert_tokens_to_ids(START_CALL)
+        self.end = tokenizer.convert_tokens_to_ids(END_CALL)
+        self.escape = tokenizer.convert_tokens_to_ids(ESCAPE)
+        self.call_prefix = self.encode("call:")
+
+        self.tools = {}
+        for tool in tools:
+            function = tool.get("function", tool)
+            parameters = function.get("parameters", {})
+            self.tools[function["name"]] = {
+                "properties": parameters.get("properties", {}),
+                "required": set(parameters.get("required", []))
+            }
+        # Include the delimiter so no alternative is a prefix of another
+        self.names = _Trie({name: self.encode(name + "{") for name in self.tools})
+
+        vocab = tokenizer.get_vocab()
+        self.digits = {i for token, i in vocab.items() if token.isascii() and token.isdigit()}
+        self.minus = {i for token, i in vocab.items() if token == "-"}
+        self.point = {i for token, i in vocab.items() if token == "."}
+
+    def encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def argument_trie(self, name, remaining, required_left):
+        """Alternatives after '{' or ',': another argument name, or '}' once required args are in"""
+        properties = self.tools[name]["properties"]
+        alternatives = {}
+        for param in remaining:
+            ids = self.encode(param + ":")
+            if self._is_string(properties[param]):
+                ids = ids + [self.escape]
+            alternatives[param] = ids
+        if not required_left:
+            alternatives["}"] = self.encode("}") + [self.end]
+        return _Trie(alternatives)
+
+    def after_value_trie(self, remaining, required_left):
+        alternatives = {}
+        if remaining:
+            alternatives[","] = self.encode(",")
+        if not required_left:
+            alternatives["}"] = self.encode("}") + [self.end]
+        return _Trie(alternatives)
+
+    @staticmethod
+    def _is_string(schema):
+        return schema.get("type", "string") == "string"
+
+    def program(self, max_calls=1):
+        """Generator of decoding instructions; the decoder sends back chosen labels"""
+        for index in range(max_calls):
+            if index > 0:
+                # Only carry on if the model itself opens another call
+                more = yield ("optional", self.start)
+                if not more:
+                    return
+            else:
+                yield ("literal", [self.start])
+            yield ("literal", self.call_prefix)
+            name = yield ("choice", self.names)
+
+            properties = self.tools[name]["properties"]
+            required = set(self.tools[name]["required"])
+            remaining = list(properties)
+            label = yield ("choice", self.argument_trie(name, remaining, required))
+
+            while label != "}":
+                param = label
+                remaining.remove(param)
+                required.discard(param)
+                after = self.after_value_trie(remaining, required)
+                schema = properties[param]
+                if "enum" not in schema and schema.get("type") in ("integer", "number"):
+                    # Digits run until the model picks what comes after the value
+                    allowed = self.digits | (self.point if schema["type"] == "number" else set())
+                    max_digits = MAX_NUMBER_TOKENS
+                    bounds = [schema[k] for k in ("minimum", "maximum") if k in schema]
+                    if bounds and schema["type"] == "integer":
+                        max_digits = max(len(str(abs(int(b)))) for b in bounds)
+                    label = yield ("number", allowed, self.minus, after, max_digits)
+                else:
+                    yield from self._value(schema)
+                    label = yield ("choice", after)
+                if label == ",":
+                    label = yield ("choice", self.argument_trie(name, remaining, required))
+
+    def _value(self, schema):
+        kind = schema.get("type", "string")
+        if "enum" in schema:
+            suffix = [self.escape] if kind == "string" else []
+            yield ("choice", _Trie({str(v): self.encode(str(v)) + suffix for v in schema["enum"]}))
+        elif kind == "boolean":
+            yield ("choice", _Trie({v: self.encode(v) for v in ("true", "false")}))
+        else:
+            yield ("string",)
+
+class ConstrainedDecoder:
+    """Greedy decoding that follows a CallGrammar and skips forced tokens"""
+
+    def __init__(self, processor, model, prefix_cache=None):
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.grammars = {}
+        self.forward_passes = 0
+        self.forced_tokens = 0
+        self.truncated = 0  # completions cut off by the budget inside a string
+        self.eos_ids = sorted(eos_token_ids(model, self.tokenizer))
+
+    def supports(self, tools):
+        """True if these tools can be decoded under a grammar (else decode them unconstrained)"""
+        return supports(tools)
+
+    def grammar(self, tools):
+        """Compile (once per tool set) the grammar for these tools"""
+        key = json.dumps(tools, sort_keys=True, default=str)
+        if key not in self.grammars:
+            self.grammars[key] = CallGrammar(self.tokenizer, tools)
+        return self.grammars[key]
+
+    @torch.no_grad()
+    def generate(self, input_ids, tools, max_calls=1, max_new_tokens=None):
+        """Decode calls for a prompt (list of token ids) and return the generated ids"""
+        grammar = self.grammar(tools)
+        cache, cached = None, 0
+        if self.prefix_cache:
+            cache, cached = self.prefix_cache.match(input_ids)
+
+        state = {"cache": cache, "pending": list(input_ids[cached:]), "generated": []}
+        limit = max_new_tokens or MAX_BUDGET
+
+        def logits():
+            ids = torch.tensor([state["pending"]], device=self.model.device)
+            out = self.model(input_ids=ids, past_key_values=state["cache"], use_cache=True)
+            self.forward_passes += 1
+            state["cache"] = out.past_key_values
+            state["pending"] = []
+            return out.logits[0, -1]
+
+        def append(token, forced=False):
+            if len(state["generated"]) >= limit:
+                raise _OutOfBudget()
+            state["pending"].append(token)
+            state["generated"].append(token)
+            if forced:
+                self.forced_tokens += 1
+
+        def pick(scores, allowed):
+            mask = torch.full_like(scores, float("-inf"))
+            index = torch.tensor(sorted(allowed), device=scores.device)
+            mask[index] = 0
+            return int((scores + mask).argmax())
+
+        def walk(trie, first=None):
+            """Follow a trie to a label, asking the model only where it branches"""
+            node = trie.root
+            if first is not None:
+                append(first)
+                node = node[first]
+            while None not in node:
+                options = list(node)
+                if len(options) == 1:
+                    token = options[0]
+                    append(token, forced=True)
+                else:
+                    token = pick(logits(), options)
+                    append(token)
+                node = node[token]
+            return node[None]
+
+        program = grammar.program(max_calls)
+        reply = None
+        try:
+            while True:
+                instruction = program.send(reply)
+                reply = None
+                kind = instruction[0]
+
+                if kind == "literal":
+                    for token in instruction[1]:
+                        append(token, forced=True)
+                elif kind == "optional":
+                    if len(state["generated"]) >= limit:
+                        reply = False
+                    else:
+                        reply = int(logits().argmax()) == instruction[1]
+                        if reply:
+                            append(instruction[1])
+                elif kind == "choice":
+                    reply = walk(instruction[1])
+                elif kind == "number":
+                    allowed, sign, after, max_digits = instruction[1:]
+                    digits, signed = 0, False
+                    while digits < max_digits:
+                        options = set(allowed)
+                        if digits == 0 and not signed:
+                            options |= sign
+                        if digits > 0:
+                            options |= set(after.root)
+                        token = pick(logits(), options)
+                        if digits > 0 and token in after.root:
+                            reply = walk(after, first=token)
+                            break
+                        append(token)
+                        if token in sign:
+                            signed = True
+                        else:
+                            digits += 1
+                    else:
+                        reply = walk(after)
+                elif kind == "string":
+                    # No call markers or end of sequence before the closing <escape>
+                    banned = torch.tensor([grammar.start, grammar.end] + self.eos_ids, device=self.model.device)
+                    token = None
+                    while token != grammar.escape:
+                        if len(state["generated"]) >= limit:
+                            self.truncated += 1
+                            metrics.count("truncated_strings", 1)
+                            raise _OutOfBudget()
+                        scores = logits()
+                        scores[banned] = float("-inf")
+                        token = int(scores.argmax())
+                        append(token)
+        except (StopIteration, _OutOfBudget):
+            pass
+
+        return state["generated"]
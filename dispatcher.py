@@ -1,15 +1,17 @@
-import json
-import functions
+from functions import registry
+from registry import ToolExecutor
+
+# Calls from one assistant turn run concurrently; see ToolExecutor
+executor = ToolExecutor(registry)
 
 def dispatch(function_call):
     name = function_call["name"]
-    args = function_call["arguments"]
-
-    if name == "toggle_wifi":
-        return functions.toggle_wifi(**args)
-    elif name == "open_app":
-        return functions.open_app(**args)
-    elif name == "set_volume":
-        return functions.set_volume(**args)
+
+    if name in registry:
+        return registry.dispatch(function_call)
     else:
         return f"Error: Unknown function '{name}'"
+
+def dispatch_all(function_calls):
+    """Run one turn's calls concurrently and return their results in order"""
+    return executor.run(function_calls)
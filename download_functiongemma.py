@@ -1,22 +1,35 @@
-from transformers import AutoProcessor, AutoModelForCausalLM
-import os
+"""
+Populate the local model store (see model_store.py).
 
-MODEL_NAME = "google/functiongemma-270m-it"
-LOCAL_DIR = "./local_models/functiongemma-270m-it"
+Re-running resumes an interrupted download; the store only becomes usable
+once every file has been checked against the Hub's hashes.
 
-os.makedirs(LOCAL_DIR, exist_ok=True)
+    python download_functiongemma.py                 # latest snapshot
+    python download_functiongemma.py --revision <commit>
+    python download_functiongemma.py --verify        # recheck stored files offline
+"""
 
-print("Downloading processor...")
-processor = AutoProcessor.from_pretrained(
-    MODEL_NAME,
-    cache_dir=LOCAL_DIR
-)
+import argparse
 
-print("Downloading model...")
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    cache_dir=LOCAL_DIR
-)
+from model_store import LOCAL_DIR, MODEL_NAME, download, is_verified, read_manifest, verify
 
-print("Download complete!")
-print(f"Model cached inside: {LOCAL_DIR}")
+parser = argparse.ArgumentParser(description=f"Download {MODEL_NAME} into {LOCAL_DIR}")
+parser.add_argument("--revision", default="main", help="Branch, tag or commit to pin")
+parser.add_argument("--verify", action="store_true", help="Recheck the stored files' hashes, without downloading")
+args = parser.parse_args()
+
+if args.verify:
+    bad = verify()
+    if bad:
+        print("Corrupted or missing: " + ", ".join(bad))
+        print("Run python download_functiongemma.py to repair the store")
+        raise SystemExit(1)
+    print("All files match the manifest")
+    if not is_verified(read_manifest()):
+        print("The manifest was recorded from an existing download, not the Hub's hashes; "
+              "run python download_functiongemma.py to verify it")
+else:
+    print(f"Downloading {MODEL_NAME}...")
+    manifest = download(args.revision)
+    print("Download complete!")
+    print(f"Pinned revision {manifest['revision']} ({len(manifest['files'])} files) in: {LOCAL_DIR}")
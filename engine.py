@@ -0,0 +1,307 @@
+import threading
+import time
+import torch
+from collections import OrderedDict
+import metrics
+from parsing import extract_tool_calls, format_call
+from prefix_cache import PrefixCache
+from prompt import PromptRenderer
+from session import ChatSession
+from stopping import stopping_criteria, token_budget
+from streaming import StreamingCallParser, TokenStreamer
+
+def decoding_modes(batch_size=None, constrained=False, compiled=False, speculative=False, restricted_head=False):
+    """Names of the enabled decoding modes; each replaces the plain generate loop, so only one may be on"""
+    options = {
+        "batch_size": batch_size, "constrained": constrained, "compiled": compiled,
+        "speculative": speculative, "restricted_head": restricted_head
+    }
+    return [name for name, enabled in options.items() if enabled]
+
+DEVELOPER_PROMPT = "You are a model that can do function calling with the following functions"
+
+WARM_UP_MESSAGES = [
+    {"role": "developer", "content": DEVELOPER_PROMPT},
+    {"role": "user", "content": "Set volume to 50"}
+]
+
+WARM_UP_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "set_volume",
+            "description": "Set system volume level",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "level": {"type": "integer"}
+                },
+                "required": ["level"]
+            }
+        }
+    }
+]
+
+class Engine:
+    """Wraps a loaded processor/model pair and turns chat messages into completions"""
+
+    def __init__(self, processor, model, batch_size=None, prefix_cache=True, max_sessions=16,
+                 constrained=False, response_cache=None, router=None, retriever=None, compiled=False,
+                 speculative=False, restricted_head=False):
+        modes = decoding_modes(batch_size, constrained, compiled, speculative, restricted_head)
+        if len(modes) > 1:
+            raise ValueError(f"Only one decoding mode can be enabled at a time, got {', '.join(modes)}")
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        # model.generate is not safe to run concurrently on one model
+        self.lock = threading.Lock()
+        # Developer prompt + tool declarations are rendered and tokenized once per tool set
+        self.renderer = PromptRenderer(processor)
+        # ...and prefilled once per tool set
+        self.prefix_cache = PrefixCache(processor, model, renderer=self.renderer) if prefix_cache else None
+        # With a batch size, concurrent requests share one continuous-batching decode loop
+        self.batcher = None
+        if batch_size:
+            from batching import ContinuousBatcher
+            self.batcher = ContinuousBatcher(
+                processor, model, max_batch_size=batch_size, prefix_cache=self.prefix_cache
+            )
+        # Grammar-constrained decoding: always a well-formed call, fewer forward passes
+        self.decoder = None
+        if constrained:
+            from constrained import ConstrainedDecoder
+            self.decoder = ConstrainedDecoder(processor, model, prefix_cache=self.prefix_cache)
+        # Large tool catalogues are narrowed per query by a ToolRetriever
+        self.retriever = retriever
+        # Static KV cache + torch.compile'd decode step for the plain generate path
+        self.compiled = None
+        if compiled:
+            from compiled import CompiledBackend
+            self.compiled = CompiledBackend(processor, model)
+        # Prompt-lookup speculative decoding: argument values copied from the prompt take one pass
+        self.speculator = None
+        if speculative:
+            from speculative import PromptLookupDecoder
+            self.speculator = PromptLookupDecoder(processor, model, prefix_cache=self.prefix_cache)
+        # Inside calls, logits only for the tokens the tools and the prompt can use
+        self.restricted = None
+        if restricted_head:
+            from restricted import RestrictedDecoder
+            self.restricted = RestrictedDecoder(processor, model, prefix_cache=self.prefix_cache)
+        # Trivial single-turn commands can be answered by an IntentRouter without the model
+        self.router = router
+        # Repeated single-turn commands are answered from a ResponseCache
+        self.response_cache = response_cache
+        # Multi-turn conversations keep their KV cache between turns
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+
+    def session(self, session_id):
+        """Return the ChatSession for session_id, creating it if needed"""
+        with self.lock:
+            if session_id not in self.sessions:
+                self.sessions[session_id] = ChatSession(
+                    self.processor, self.model, self.prefix_cache, renderer=self.renderer
+                )
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+
+    def end_session(self, session_id):
+        """Drop a finished conversation's cache"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def generate(self, messages, tools, max_new_tokens=None, session=None, max_calls=1, streamer=None):
+        """Generate a completion for the messages and return the decoded text
+
+        Decoding stops once max_calls complete calls are out; max_new_tokens
+        defaults to a budget derived from the tool schemas. A streamer, if
+        given, receives tokens as they are generated (not in batching mode).
+        """
+        if max_new_tokens is None:
+            max_new_tokens = token_budget(self.tokenizer, tools, max_calls, messages)
+
+        if session is not None:
+            chat = self.session(session)
+            with self.lock:
+                return chat.generate(
+                    messages, tools, max_new_tokens=max_new_tokens, max_calls=max_calls, streamer=streamer
+                )
+
+        with metrics.timer("render"):
+            input_ids = self.renderer.render(messages, tools)
+        prompt_length = len(input_ids)
+        metrics.count("prompt_tokens", prompt_length)
+
+        if self.batcher:
+            if self.prefix_cache:
+                self.prefix_cache.ensure(messages, tools)
+            future = self.batcher.submit(input_ids, max_new_tokens, max_calls)
+            return self.processor.decode(future.result(), skip_special_tokens=True)
+
+        if self.decoder and tools and self.decoder.supports(tools):
+            with self.lock:
+                if self.prefix_cache:
+                    self.prefix_cache.ensure(messages, tools)
+                generated = self.decoder.generate(
+                    input_ids, tools, max_calls=max_calls, max_new_tokens=max_new_tokens
+                )
+            if streamer:
+                streamer.put(torch.tensor([input_ids]))
+                streamer.put(torch.tensor(generated))
+                streamer.end()
+            return self.processor.decode(generated, skip_special_tokens=True)
+
+        if self.compiled:
+            with self.lock:
+                generated = self.compiled.generate(input_ids, max_new_tokens, max_calls, streamer)
+            # None: too long for the largest bucket, decode eagerly instead
+            if generated is not None:
+                return self.processor.decode(generated, skip_special_tokens=True)
+
+        if self.restricted and tools:
+            with self.lock:
+                if self.prefix_cache:
+                    self.prefix_cache.ensure(messages, tools)
+                generated = self.restricted.generate(input_ids, messages, tools, max_new_tokens, max_calls, streamer)
+            return self.processor.decode(generated, skip_special_tokens=True)
+
+        if self.speculator:
+            with self.lock:
+                if self.prefix_cache:
+                    self.prefix_cache.ensure(messages, tools)
+                generated = self.speculator.generate(input_ids, max_new_tokens, max_calls, streamer)
+            return self.processor.decode(generated, skip_special_tokens=True)
+
+        with self.lock:
+            past_key_values = None
+            if self.prefix_cache:
+                self.prefix_cache.ensure(messages, tools)
+                past_key_values, _ = self.prefix_cache.match(input_ids)
+
+            ids = torch.tensor([input_ids], device=self.model.device)
+            outputs = self.model.generate(
+                input_ids=ids,
+                attention_mask=torch.ones_like(ids),
+                past_key_values=past_key_values,
+                pad_token_id=self.processor.eos_token_id,
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=stopping_criteria(self.tokenizer, prompt_length, max_calls),
+                streamer=streamer
+            )
+
+        return self.processor.decode(outputs[0][prompt_length:], skip_special_tokens=True)
+
+    def complete(self, messages, tools, max_new_tokens=None, session=None, max_calls=1, route=True):
+        """Generate a completion and return the raw text together with the parsed calls"""
+        start = time.perf_counter()
+        tools = self._select_tools(messages, tools, session)
+
+        call = route and self._route(messages, tools, session, max_new_tokens, max_calls)
+        if call:
+            elapsed = time.perf_counter() - start
+            metrics.observe("request", elapsed)
+            return {"response": format_call(call), "calls": [call], "routed": True, "elapsed": elapsed}
+
+        def compute():
+            response = self.generate(
+                messages, tools, max_new_tokens=max_new_tokens, session=session, max_calls=max_calls
+            )
+            with metrics.timer("parse"):
+                calls = extract_tool_calls(response, tools)
+            return {"response": response, "calls": calls}
+
+        key = self._cache_key(messages, tools, session, max_new_tokens, max_calls)
+        result = self.response_cache.get_or_compute(key, compute) if key else compute()
+        elapsed = time.perf_counter() - start
+        metrics.observe("request", elapsed)
+        return dict(result, elapsed=elapsed)
+
+    def _select_tools(self, messages, tools, session):
+        """The tools relevant to the latest user message, or all of them"""
+        # A session's tool set has to stay fixed for its KV cache to be reused
+        if self.retriever is None or session is not None or not tools:
+            return tools
+        query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
+        if not isinstance(query, str):
+            return tools
+        return self.retriever.select(query, tools)
+
+    def _route(self, messages, tools, session, max_new_tokens, max_calls):
+        """Router call for single-turn requests it is confident about, else None"""
+        if self.router is None or session is not None or not tools:
+            return None
+        if len(messages) != 2 or messages[-1]["role"] != "user":
+            return None
+        return self.router.route(messages[-1]["content"], tools)
+
+    def _cache_key(self, messages, tools, session, max_new_tokens, max_calls):
+        """Response cache key for single-turn requests with default limits, else None"""
+        if self.response_cache is None or session is not None:
+            return None
+        if max_new_tokens is not None or max_calls != 1:
+            return None
+        return self.response_cache.key(messages, tools)
+
+    def stream(self, messages, tools, max_new_tokens=None, session=None, max_calls=1):
+        """Yield {"call": ...} as soon as each call's closing brace is decoded, then the complete() result"""
+        start = time.perf_counter()
+        tools = self._select_tools(messages, tools, session)
+        call = self._route(messages, tools, session, max_new_tokens, max_calls)
+        if call:
+            yield {"call": call}
+            yield {"response": format_call(call), "calls": [call], "routed": True,
+                   "elapsed": time.perf_counter() - start}
+            return
+
+        if self._cache_key(messages, tools, session, max_new_tokens, max_calls):
+            # Cached or coalesced requests have nothing to stream
+            result = self.complete(messages, tools, max_new_tokens, session, max_calls, route=False)
+            for call in result["calls"]:
+                yield {"call": call}
+            yield result
+            return
+
+        parser = StreamingCallParser(tools)
+        kwargs = dict(max_new_tokens=max_new_tokens, session=session, max_calls=max_calls)
+
+        thread, errors = None, []
+        if self.batcher and session is None:
+            # The shared decode loop doesn't stream; parse once it finishes
+            chunks = [self.generate(messages, tools, **kwargs)]
+        else:
+            chunks = TokenStreamer(self.tokenizer)
+
+            def run():
+                try:
+                    self.generate(messages, tools, streamer=chunks, **kwargs)
+                except Exception as e:
+                    errors.append(e)
+                    chunks.end()
+
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+
+        response = ""
+        for chunk in chunks:
+            response += chunk
+            for call in parser.feed(chunk):
+                yield {"call": call}
+
+        if thread:
+            thread.join()
+            if errors:
+                raise errors[0]
+
+        elapsed = time.perf_counter() - start
+        metrics.observe("request", elapsed)
+        yield {"response": response, "calls": parser.calls, "elapsed": elapsed}
+
+    def warm_up(self):
+        """Run one short generation so the first real request doesn't pay for lazy init"""
+        if self.compiled:
+            self.compiled.warm_up()
+        self.generate(WARM_UP_MESSAGES, WARM_UP_TOOLS, max_new_tokens=16)
@@ -1,8 +1,34 @@
-def toggle_wifi(state: str):
+from typing import Literal
+from registry import ToolRegistry
+
+registry = ToolRegistry()
+
+@registry.tool
+def toggle_wifi(state: Literal["on", "off"]):
+    """
+    Turn WiFi on or off
+
+    Args:
+        state: Either 'on' or 'off'
+    """
     return f"WiFi turned {state}"
 
+@registry.tool
 def open_app(app_name: str):
+    """
+    Open an application
+
+    Args:
+        app_name: Name of the application to open
+    """
     return f"Opening app: {app_name}"
 
+@registry.tool
 def set_volume(level: int):
+    """
+    Set system volume level
+
+    Args:
+        level: Volume level from 0 to 100
+    """
     return f"Volume set to {level}%"
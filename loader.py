@@ -1,21 +1,73 @@
-from transformers import AutoProcessor, AutoModelForCausalLM
 import os
 
-LOCAL_DIR = "./local_models/functiongemma-270m-it"
-MODEL_NAME = "google/functiongemma-270m-it"
+from model_store import LOCAL_DIR, resolve
 
-# Ensure directory exists
-os.makedirs(LOCAL_DIR, exist_ok=True)
+# Int8 dynamic-quantized model, saved after the first conversion
+QUANTIZED_PATH = os.path.join(LOCAL_DIR, "functiongemma-270m-it-int8.pt")
 
-processor = AutoProcessor.from_pretrained(
-    MODEL_NAME,
-    cache_dir=LOCAL_DIR,
-    local_files_only=True
-)
+_loaded = {}
 
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    cache_dir=LOCAL_DIR,
-    local_files_only=True,
-    device_map="auto"
-)
+def load_model(quantize=False):
+    """Load the processor and model once per process and return both
+
+    With quantize=True the linear layers are dynamically quantized to int8
+    for CPU inference.
+    """
+    if quantize in _loaded:
+        return _loaded[quantize]
+
+    # Nothing is fetched from the Hub at load time (only download_functiongemma.py does)
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    # Imported here so importing loader (for its paths) stays cheap
+    from transformers import AutoProcessor, AutoModelForCausalLM
+
+    snapshot = resolve()
+
+    processor = AutoProcessor.from_pretrained(snapshot, local_files_only=True)
+
+    if quantize:
+        model = _load_quantized(snapshot)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            snapshot,
+            local_files_only=True,
+            device_map="auto"
+        )
+    model.eval()
+
+    _loaded[quantize] = (processor, model)
+    return _loaded[quantize]
+
+def _load_quantized(snapshot):
+    """Int8 model from QUANTIZED_PATH, converting and saving it on the first run"""
+    import torch
+    import transformers
+    from transformers import AutoModelForCausalLM
+
+    # The artifact is a pickled module, only valid for the versions (and weights) that wrote it
+    versions = {
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "snapshot": os.path.basename(snapshot)
+    }
+    if os.path.exists(QUANTIZED_PATH):
+        try:
+            saved = torch.load(QUANTIZED_PATH, weights_only=False)
+            if saved.get("versions") == versions:
+                return saved["model"]
+        except Exception as e:
+            print(f"Ignoring unreadable {QUANTIZED_PATH}: {e}")
+
+    print("Quantizing model to int8 (first run only)...")
+    model = AutoModelForCausalLM.from_pretrained(
+        snapshot,
+        local_files_only=True,
+        torch_dtype=torch.float32
+    )
+    model.eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    partial = QUANTIZED_PATH + ".partial"
+    torch.save({"versions": versions, "model": model}, partial)
+    os.replace(partial, QUANTIZED_PATH)
+    return model
@@ -0,0 +1,177 @@
+"""
+Token-budgeted conversation history.
+
+ConversationMemory keeps the prefix (developer turn with the tool
+declarations, plus anything else pinned there such as a multi-step task) and
+the latest turns verbatim. When the prompt would go over the budget, older
+turns are compacted first: tool results shrink to one-line summaries and long
+string arguments are shortened. If that still isn't enough, the oldest turns
+are dropped, then the kept turns are compacted as well, and then dropped
+down to the latest one. If the prompt still doesn't fit, BudgetExceeded is
+raised rather than returning a prompt over the budget. A compacted turn stays
+compacted, so earlier messages don't keep changing between turns and a
+session's KV cache stays reusable.
+
+Token counts use the backend's own tokenizer, and the developer turn with the
+tool declarations is measured as its renderer renders it. With a remote
+server (a client.Client) there is no tokenizer in the process, so counts are
+estimated at four characters per token.
+"""
+
+import json
+
+SUMMARY_CHARS = 80
+ARGUMENT_CHARS = 40
+# <start_of_turn>role\n ... <end_of_turn>\n around every message
+MESSAGE_OVERHEAD = 4
+
+def estimate_tokens(text):
+    """Rough token count for text without a tokenizer"""
+    return len(text) // 4 + 1
+
+def _renderer(backend):
+    """The PromptRenderer of a local engine, or None for a server client (or no backend)"""
+    return getattr(backend, "renderer", None) if backend is not None else None
+
+def backend_counter(backend):
+    """Token counter backed by the backend's tokenizer, or estimate_tokens if it has none"""
+    renderer = _renderer(backend)
+    if renderer is None:
+        return estimate_tokens
+    tokenizer = renderer.tokenizer
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def _text(message):
+    content = message.get("content") or ""
+    text = content if isinstance(content, str) else json.dumps(content)
+    if message.get("tool_calls"):
+        text += json.dumps(message["tool_calls"])
+    return message["role"] + text
+
+def _shorten(text, limit):
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+def summarize(response):
+    """One-line summary of a tool response"""
+    if isinstance(response, dict) and "message" in response:
+        return _shorten(f"{response.get('status', 'ok')}: {response['message']}", SUMMARY_CHARS)
+    return _shorten(response if isinstance(response, str) else json.dumps(response), SUMMARY_CHARS)
+
+def compact(message):
+    """The message with tool results summarized and long string arguments shortened"""
+    if message["role"] == "tool" and isinstance(message.get("content"), list):
+        results = [dict(r, response=summarize(r.get("response"))) for r in message["content"]]
+        return dict(message, content=results)
+    if message.get("tool_calls"):
+        calls = []
+        for call in message["tool_calls"]:
+            function = call.get("function", call)
+            arguments = {k: _shorten(v, ARGUMENT_CHARS) if isinstance(v, str) else v
+                         for k, v in function.get("arguments", {}).items()}
+            calls.append(dict(call, function=dict(function, arguments=arguments)))
+        return dict(message, tool_calls=calls)
+    return message
+
+class BudgetExceeded(RuntimeError):
+    """The prefix, the latest turn and the new messages alone don't fit the budget"""
+
+class ConversationMemory:
+    """Conversation history kept under a prompt token budget"""
+
+    def __init__(self, prefix, tools=(), budget=2048, keep_turns=2, count_tokens=None, backend=None):
+        self.prefix = list(prefix)
+        self.tools = tools
+        self.backend = backend
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self._count_tokens = count_tokens
+        self._prefix_tokens = None
+        self.turns = []  # {"messages", "tokens", "compacted"}
+        self.dropped = 0
+
+    @property
+    def count_tokens(self):
+        # Resolved on first use: a backend loading in the background isn't waited for earlier
+        if self._count_tokens is None:
+            self._count_tokens = backend_counter(self.backend)
+        return self._count_tokens
+
+    def _prefix_cost(self):
+        # The developer turn and tool declarations as the backend renders them
+        renderer = _renderer(self.backend)
+        if renderer is not None:
+            _, prefix_ids = renderer.prefix(self.prefix, list(self.tools))
+            if prefix_ids is not None:
+                return len(prefix_ids) + self._tokens(self.prefix[1:])
+        return self._tokens(self.prefix) + self.count_tokens(json.dumps(list(self.tools)))
+
+    def _tokens(self, messages):
+        return sum(self.count_tokens(_text(m)) + MESSAGE_OVERHEAD for m in messages)
+
+    def tokens(self, extra=()):
+        """Prompt tokens of the prefix, the kept history and any extra messages"""
+        if self._prefix_tokens is None:
+            self._prefix_tokens = self._prefix_cost()
+        return self._prefix_tokens + sum(t["tokens"] for t in self.turns) + self._tokens(extra)
+
+    def append(self, message):
+        """Add a message; a user message, or a second assistant message, starts a new turn"""
+        current = self.turns[-1]["messages"] if self.turns else None
+        if (current is None or message["role"] == "user"
+                or (message["role"] == "assistant" and any(m["role"] == "assistant" for m in current))):
+            self.turns.append({"messages": [], "tokens": 0, "compacted": False})
+        turn = self.turns[-1]
+        turn["messages"].append(message)
+        turn["tokens"] += self._tokens([message])
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def _compact(self, turns, extra):
+        for turn in turns:
+            if self.tokens(extra) <= self.budget:
+                return
+            if not turn["compacted"]:
+                turn["messages"] = [compact(m) for m in turn["messages"]]
+                turn["tokens"] = self._tokens(turn["messages"])
+                turn["compacted"] = True
+
+    def _drop(self, keep, extra):
+        while len(self.turns) > keep and self.tokens(extra) > self.budget:
+            self.turns.pop(0)
+            self.dropped += 1
+
+    def _fit(self, extra):
+        # Older turns are compacted, then dropped; only then the kept turns
+        self._compact(self.turns[:max(0, len(self.turns) - self.keep_turns)], extra)
+        self._drop(self.keep_turns, extra)
+        self._compact(self.turns, extra)
+        self._drop(1, extra)
+        tokens = self.tokens(extra)
+        if tokens > self.budget:
+            raise BudgetExceeded(f"Prompt needs {tokens} tokens even with its history compacted, "
+                                 f"over the budget of {self.budget}")
+
+    def messages(self, extra=()):
+        """Prompt messages: prefix, history fitted to the budget, then extra (e.g. the new user message)"""
+        extra = list(extra)
+        self._fit(extra)
+        history = [m for turn in self.turns for m in turn["messages"]]
+        return self.prefix + history + extra
+
+    def usage(self, extra=()):
+        """Token usage of the current prompt"""
+        return {
+            "tokens": self.tokens(extra),
+            "budget": self.budget,
+            "turns": len(self.turns),
+            "compacted": sum(t["compacted"] for t in self.turns),
+            "dropped": self.dropped
+        }
+
+    def report(self, extra=()):
+        """One-line usage summary"""
+        u = self.usage(extra)
+        return (f"Context: {u['tokens']}/{u['budget']} tokens, {u['turns']} turns "
+                f"({u['compacted']} compacted, {u['dropped']} dropped)")
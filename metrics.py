@@ -0,0 +1,185 @@
+"""
+Per-stage latency metrics.
+
+Off by default: enable with FUNCTIONGEMMA_METRICS=1 or metrics.enable()
+(server.py --metrics). While disabled every hook costs one flag check, and
+timer() returns a shared no-op context manager.
+
+Stages (histograms, seconds):
+    render          chat template + tokenization of the prompt
+    prefill         prompt forward pass, up to the first generated token
+    decode_token    each further generated token
+    parse           parsing the calls out of a completion
+    request         Engine.complete, end to end
+    tool            each tool run (label: tool)
+Counters: prompt_tokens, generated_tokens.
+
+prometheus() renders them in the Prometheus text format and snapshot() as a
+JSON-able dict; the server serves both on /metrics and /metrics.json.
+
+    FUNCTIONGEMMA_METRICS=1 python interactive_demo.py    # then type 'metrics'
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+ENABLED = os.environ.get("FUNCTIONGEMMA_METRICS", "") not in ("", "0")
+PREFIX = "functiongemma_"
+# Upper bounds in seconds, from a parse (tens of microseconds) to a long generation
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    "render": "Chat template rendering and tokenization of the prompt",
+    "prefill": "Prompt forward pass up to the first generated token",
+    "decode_token": "Time per generated token after the first",
+    "parse": "Parsing calls out of a completion",
+    "request": "Engine.complete end to end",
+    "tool": "Tool execution",
+    "prompt_tokens": "Prompt tokens rendered",
+    "generated_tokens": "Tokens generated"
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}  # (name, labels) -> total
+_NULL = nullcontext()
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate, interpolating linearly inside the bucket holding the q-th value"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+def enable(enabled=True):
+    """Turn recording on (or off)"""
+    global ENABLED
+    ENABLED = enabled
+
+def reset():
+    """Drop everything recorded so far"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def observe(name, seconds, **labels):
+    """Record one latency sample"""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+def count(name, amount=1, **labels):
+    """Add to a counter"""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def timer(name, **labels):
+    """Context manager recording its block's duration under name"""
+    return _Timer(name, labels) if ENABLED else _NULL
+
+def snapshot():
+    """Everything recorded, as a JSON-able dict"""
+    with _lock:
+        histograms = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": h.count,
+                "sum": h.sum,
+                "p50": h.quantile(0.5),
+                "p95": h.quantile(0.95),
+                "p99": h.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts))
+            }
+            for (name, labels), h in sorted(_histograms.items())
+        ]
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+    return {"enabled": ENABLED, "histograms": histograms, "counters": counters}
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in pairs}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+def prometheus():
+    """Everything recorded, in the Prometheus text exposition format"""
+    lines, described = [], set()
+    with _lock:
+        for (name, labels), h in sorted(_histograms.items()):
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in described:
+                described.add(metric)
+                lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {h.sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {h.count}")
+        for (name, labels), value in sorted(_counters.items()):
+            metric = f"{PREFIX}{name}_total"
+            if metric not in described:
+                described.add(metric)
+                lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def summary():
+    """Human-readable table of the histograms and counters"""
+    data = snapshot()
+    rows = [f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>11}"]
+    for h in data["histograms"]:
+        label = h["name"] + "".join(f" {v}" for v in h["labels"].values())
+        rows.append(f"{label:<28}{h['count']:>7}{h['p50'] * 1000:>10.2f}{h['p95'] * 1000:>10.2f}{h['sum'] * 1000:>11.1f}")
+    for c in data["counters"]:
+        rows.append(f"{c['name']:<28}{c['value']:>7}")
+    return "\n".join(rows)
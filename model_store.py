@@ -0,0 +1,175 @@
+"""
+Local model store.
+
+The model is kept in the Hugging Face cache layout under LOCAL_DIR
+(models--google--functiongemma-270m-it/snapshots/<commit>/...). MANIFEST_PATH
+pins one snapshot: its commit and the size and sha256 of every file, checked
+against the Hub's own hashes when download_functiongemma.py wrote it.
+
+resolve() reads the manifest and returns the snapshot directory without any
+network access, so every entry point loads the model from a plain local path.
+The manifest is written last, so an interrupted download never leaves a store
+that resolve() accepts.
+
+A snapshot downloaded before the store had a manifest is adopted if it has
+a config, weights and a tokenizer, but its manifest records it as unverified
+until download_functiongemma.py has checked it against the Hub's file list
+and hashes.
+"""
+
+import hashlib
+import json
+import os
+
+MODEL_NAME = "google/functiongemma-270m-it"
+LOCAL_DIR = "./local_models/functiongemma-270m-it"
+MANIFEST_PATH = os.path.join(LOCAL_DIR, "manifest.json")
+
+# Files a snapshot can't load without; each entry is satisfied by any of its names
+REQUIRED_FILES = (
+    ("config.json",),
+    ("model.safetensors", "model.safetensors.index.json", "pytorch_model.bin", "pytorch_model.bin.index.json"),
+    ("tokenizer.json", "tokenizer.model")
+)
+
+def _repo_dir():
+    return os.path.join(LOCAL_DIR, "models--" + MODEL_NAME.replace("/", "--"))
+
+def _hashes(path):
+    """sha256 and git blob sha1 of a file"""
+    sha256, sha1 = hashlib.sha256(), hashlib.sha1()
+    sha1.update(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+            sha1.update(chunk)
+    return sha256.hexdigest(), sha1.hexdigest()
+
+def _write_manifest(manifest):
+    partial = MANIFEST_PATH + ".partial"
+    with open(partial, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, MANIFEST_PATH)
+
+def _manifest(revision, snapshot, files, source):
+    return {
+        "model": MODEL_NAME,
+        "revision": revision,
+        "snapshot": os.path.relpath(snapshot, LOCAL_DIR),
+        "source": source,
+        # Only a download checked against the Hub's hashes counts as verified
+        "verified": source == "hub",
+        "files": files
+    }
+
+def is_verified(manifest):
+    """Whether the manifest's hashes came from the Hub rather than the files themselves"""
+    return manifest.get("verified", manifest.get("source") == "hub")
+
+def _missing(snapshot):
+    """Required files (and weight shards named by an index) the snapshot lacks"""
+    missing = []
+    for names in REQUIRED_FILES:
+        present = [name for name in names if os.path.exists(os.path.join(snapshot, name))]
+        if not present:
+            missing.append(names[0])
+        elif present[0].endswith(".index.json"):
+            with open(os.path.join(snapshot, present[0])) as f:
+                shards = set(json.load(f).get("weight_map", {}).values())
+            missing += sorted(s for s in shards if not os.path.exists(os.path.join(snapshot, s)))
+    return missing
+
+def read_manifest():
+    """The store's manifest, or None if the model hasn't been stored yet"""
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def _adopt():
+    """Unverified manifest for a complete snapshot downloaded before the store had one"""
+    ref = os.path.join(_repo_dir(), "refs", "main")
+    if not os.path.exists(ref):
+        return None
+    with open(ref) as f:
+        revision = f.read().strip()
+    snapshot = os.path.join(_repo_dir(), "snapshots", revision)
+    if not os.path.isdir(snapshot):
+        return None
+    missing = _missing(snapshot)
+    if missing:
+        raise RuntimeError(f"The existing download of {MODEL_NAME} lacks {', '.join(missing)}; "
+                           "run: python download_functiongemma.py")
+
+    print(f"Recording a manifest for the existing download of {MODEL_NAME}...")
+    files = {}
+    for root, _, names in os.walk(snapshot):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, snapshot).replace(os.sep, "/")] = {
+                "size": os.path.getsize(path), "sha256": _hashes(path)[0]
+            }
+    manifest = _manifest(revision, snapshot, files, source="local")
+    _write_manifest(manifest)
+    return manifest
+
+def resolve():
+    """Local snapshot directory of MODEL_NAME; never touches the network"""
+    manifest = read_manifest() or _adopt()
+    if manifest is None:
+        raise RuntimeError(f"{MODEL_NAME} is not in {LOCAL_DIR}; run: python download_functiongemma.py")
+
+    snapshot = os.path.join(LOCAL_DIR, manifest["snapshot"])
+    # Sizes only: hashes were checked when the manifest was written (verify() rechecks them)
+    for name, entry in manifest["files"].items():
+        path = os.path.join(snapshot, name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            raise RuntimeError(f"{path} is missing or incomplete; run: python download_functiongemma.py")
+    if not is_verified(manifest):
+        print(f"Warning: {MODEL_NAME} snapshot {manifest['revision'][:12]} hasn't been checked against the "
+              "Hub's hashes; run python download_functiongemma.py when online")
+    return snapshot
+
+def verify():
+    """Names of stored files whose sha256 no longer matches the manifest"""
+    manifest = read_manifest()
+    if manifest is None:
+        raise RuntimeError(f"No manifest in {LOCAL_DIR}; run: python download_functiongemma.py")
+    snapshot = os.path.join(LOCAL_DIR, manifest["snapshot"])
+    bad = []
+    for name, entry in manifest["files"].items():
+        path = os.path.join(snapshot, name)
+        if not os.path.exists(path) or _hashes(path)[0] != entry["sha256"]:
+            bad.append(name)
+    return bad
+
+def download(revision="main"):
+    """Download (or resume) a pinned snapshot, check it against the Hub's hashes and record the manifest"""
+    from huggingface_hub import HfApi, snapshot_download
+
+    os.makedirs(LOCAL_DIR, exist_ok=True)
+    info = HfApi().model_info(MODEL_NAME, revision=revision, files_metadata=True)
+    # Pin the commit so every file comes from the same snapshot; files already
+    # downloaded are skipped and partial ones resumed
+    snapshot = snapshot_download(MODEL_NAME, revision=info.sha, cache_dir=LOCAL_DIR)
+
+    files = {}
+    for sibling in info.siblings:
+        path = os.path.join(snapshot, sibling.rfilename)
+        sha256, sha1 = _hashes(path)
+        if sibling.lfs:
+            ok = sha256 == sibling.lfs.sha256
+        else:
+            ok = sibling.blob_id is None or sha1 == sibling.blob_id
+        if not ok:
+            # Drop the blob too, or the next run would link the same bad file again
+            blob = os.path.realpath(path)
+            os.remove(path)
+            if os.path.exists(blob):
+                os.remove(blob)
+            raise RuntimeError(f"{sibling.rfilename} doesn't match the Hub's hash; run the download again")
+        files[sibling.rfilename] = {"size": os.path.getsize(path), "sha256": sha256}
+
+    manifest = _manifest(info.sha, snapshot, files, source="hub")
+    _write_manifest(manifest)
+    return manifest
@@ -0,0 +1,75 @@
+"""
+Prefilled KV cache for the shared prompt prefix.
+
+Every request starts with the same developer turn: the developer prompt plus
+the rendered tool declarations. PrefixCache prefills that prefix once per tool
+set and hands out copies of its past_key_values, so generation only has to
+prefill the user suffix.
+
+Entries are keyed by a hash of the rendered prefix template, so a changed tool
+list (or developer prompt) simply renders to a new key; old tool sets age out
+of the small LRU.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+from prompt import PromptRenderer
+
+class PrefixCache:
+    """LRU of prefilled developer-turn caches keyed by the rendered template hash"""
+
+    def __init__(self, processor, model, max_entries=4, renderer=None):
+        self.processor = processor
+        self.model = model
+        self.renderer = renderer or PromptRenderer(processor)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (prefix token ids, cache)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ensure(self, messages, tools):
+        """Make sure the prefix for this developer prompt + tool set is prefilled"""
+        key, prefix_ids = self.renderer.prefix(messages, tools)
+        if key is None:
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return key
+
+        ids = torch.tensor([prefix_ids], device=self.model.device)
+        with torch.no_grad():
+            # Full (not sliding-window) layers, so copies can be cropped and batched
+            out = self.model(input_ids=ids, past_key_values=DynamicCache(), use_cache=True)
+
+        with self.lock:
+            self.entries[key] = (prefix_ids, out.past_key_values)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return key
+
+    def match(self, input_ids):
+        """Return (cache copy, cached length) for the longest stored prefix of input_ids"""
+        input_ids = list(input_ids)
+        best = None
+        with self.lock:
+            for key, (prefix_ids, cache) in self.entries.items():
+                n = len(prefix_ids)
+                # Keep at least one token for the model to process
+                if n < len(input_ids) and input_ids[:n] == prefix_ids:
+                    if best is None or n > best[1]:
+                        best = (key, n, cache)
+            if best is None:
+                self.misses += 1
+                return None, 0
+            self.entries.move_to_end(best[0])
+            self.hits += 1
+            # generate() extends the cache in place, so hand out a copy
+            return copy.deepcopy(best[2]), best[1]
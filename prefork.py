@@ -0,0 +1,237 @@
+"""
+Pre-fork worker pool.
+
+One Python process can't keep a many-core box busy, and torch's intra-op
+threads scale poorly for a 270M model at batch size 1. The caller loads the
+weights once in the parent; serve() then forks N workers that share those
+pages copy-on-write (inference never writes to the weights). Each worker is
+pinned to its own CPU set, sets torch.set_num_threads, builds its own Engine
+and accepts connections on the inherited listening socket.
+
+autotune() picks workers x threads for the host from measured throughput.
+
+    python prefork.py                  # autotune table for this host
+    python server.py --workers 0       # autotune, then serve
+    python server.py --workers 4 --threads 2
+
+Needs os.fork, so Linux/macOS only. The parent keeps torch at one thread
+until it forks: an OpenMP thread pool started before fork() can deadlock the
+children.
+"""
+
+import os
+import signal
+import sys
+import time
+import traceback
+
+import torch
+
+# A worker that dies sooner than this after starting isn't restarted
+MIN_UPTIME = 5.0
+# How long throughput() waits for its workers to build and warm up an engine
+READY_TIMEOUT = 300.0
+
+def available_cpus():
+    """CPU ids this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def cpu_sets(workers, threads):
+    """CPU ids to pin each worker to (None where the host has too few to pin)"""
+    cpus = available_cpus()
+    if not hasattr(os, "sched_setaffinity") or workers * threads > len(cpus):
+        return [None] * workers
+    return [cpus[i * threads:(i + 1) * threads] for i in range(workers)]
+
+def candidates():
+    """(workers, threads) splits of this host's cores, from many single-thread workers to one wide one"""
+    cores = len(available_cpus())
+    splits, threads = [], 1
+    while threads <= cores:
+        splits.append((cores // threads, threads))
+        threads *= 2
+    return splits
+
+def _fork(target, cpus, threads, close=()):
+    """Run target() in a child pinned to cpus with the given torch thread count
+
+    The child closes the file descriptors in close (the parent's pipe ends)
+    first, so a pipe reports EOF once the processes that write to it are gone.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        for fd in close:
+            os.close(fd)
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(threads)
+        target()
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+def _require_fork():
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Pre-fork workers need os.fork, which this platform doesn't have")
+
+def serve(server, make_engine, workers, threads):
+    """Fork workers that build an engine each and serve on server's socket until they exit"""
+    _require_fork()
+    # Every worker wakes up for a new connection; the ones that lose the
+    # accept() race get EAGAIN and go back to waiting
+    server.socket.setblocking(False)
+
+    def worker():
+        server.engine = make_engine()
+        server.engine.warm_up()
+        server.serve_forever()
+
+    sets = cpu_sets(workers, threads)
+    children = {}
+    for i in range(workers):
+        children[_fork(worker, sets[i], threads)] = (i, time.monotonic())
+        print(f"Worker {i}: {threads} thread(s), CPUs {sets[i] or 'unpinned'}")
+
+    try:
+        while children:
+            pid, status = os.wait()
+            if pid not in children:
+                continue
+            i, started = children.pop(pid)
+            if os.waitstatus_to_exitcode(status) == 0:
+                continue
+            if time.monotonic() - started < MIN_UPTIME:
+                print(f"Worker {i} failed during startup; not restarting it")
+                continue
+            print(f"Worker {i} died; restarting it")
+            children[_fork(worker, sets[i], threads)] = (i, time.monotonic())
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+        raise
+
+def _measure(make_engine, prompts, seconds, ready, go, results):
+    engine = make_engine()
+    engine.warm_up()
+    os.write(ready, b"r")
+    os.read(go, 1)
+    completed, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        messages, tools = prompts[completed % len(prompts)]
+        engine.generate(messages, tools)
+        completed += 1
+    os.write(results, f"{completed / (time.perf_counter() - start)}\n".encode())
+
+def _await_ready(ready, pids, timeout):
+    """Read one byte per worker from ready; raise if a worker exits or timeout passes first"""
+    import select
+    deadline = time.monotonic() + timeout
+    waiting = len(pids)
+    while waiting:
+        for pid in pids:
+            exited, status = os.waitpid(pid, os.WNOHANG)
+            if exited:
+                pids.remove(pid)
+                raise RuntimeError(f"Worker {pid} exited with code {os.waitstatus_to_exitcode(status)} "
+                                   "before it was ready")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError(f"{waiting} of {len(pids)} workers weren't ready after {timeout:.0f}s")
+        if select.select([ready], [], [], min(remaining, 0.5))[0]:
+            waiting -= len(os.read(ready, waiting))
+
+def throughput(make_engine, prompts, workers, threads, seconds=10, ready_timeout=READY_TIMEOUT):
+    """Requests per second of `workers` concurrent workers with `threads` torch threads each"""
+    _require_fork()
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    results_r, results_w = os.pipe()
+    sets = cpu_sets(workers, threads)
+    pids = [
+        _fork(lambda: _measure(make_engine, prompts, seconds, ready_w, go_r, results_w), sets[i], threads,
+              close=(ready_r, go_w, results_r))
+        for i in range(workers)
+    ]
+    for fd in (ready_w, go_r, results_w):
+        os.close(fd)
+
+    # Start every worker's clock together, after all have warmed up
+    try:
+        _await_ready(ready_r, pids, ready_timeout)
+    except BaseException:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            os.waitpid(pid, 0)
+        for fd in (ready_r, go_w, results_r):
+            os.close(fd)
+        raise
+    os.write(go_w, b"g" * workers)
+
+    with os.fdopen(results_r) as f:
+        rates = [float(line) for line in f if line.strip()]
+    for pid in pids:
+        os.waitpid(pid, 0)
+    for fd in (ready_r, go_w):
+        os.close(fd)
+    if len(rates) < workers:
+        raise RuntimeError(f"{workers - len(rates)} of {workers} workers failed")
+    return sum(rates)
+
+def autotune(make_engine, prompts, seconds=10, splits=None):
+    """Measure each (workers, threads) split and return the fastest, printing a table"""
+    best, best_rate = None, 0.0
+    print(f"{'workers':>7}  {'threads':>7}  {'req/s':>7}")
+    for workers, threads in splits or candidates():
+        rate = throughput(make_engine, prompts, workers, threads, seconds)
+        print(f"{workers:>7}  {threads:>7}  {rate:>7.2f}")
+        if rate > best_rate:
+            best, best_rate = (workers, threads), rate
+    return best
+
+def reference_prompts():
+    """Single-turn requests used to measure throughput"""
+    from engine import DEVELOPER_PROMPT
+    from schemas import FUNCTIONS
+
+    utterances = ["Set volume to 50", "Turn WiFi off", "Open notepad", "Open Chrome browser"]
+    return [
+        ([{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": u}], FUNCTIONS)
+        for u in utterances
+    ]
+
+def main():
+    import argparse
+    from engine import Engine
+    from loader import load_model
+
+    parser = argparse.ArgumentParser(description="Measure throughput of each workers x threads split")
+    parser.add_argument("--seconds", type=float, default=10, help="Measurement time per split")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    processor, model = load_model()
+    best = autotune(lambda: Engine(processor, model), reference_prompts(), args.seconds)
+    print(f"\nBest: --workers {best[0]} --threads {best[1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Prompt rendering with the developer turn rendered once per tool set.
+
+Rendering the tool declarations through the chat template and tokenizing them
+costs the same on every request. PromptRenderer renders and tokenizes the
+developer turn (prompt + tools) once per tool set, then renders and tokenizes
+only the remaining messages. The concatenation is checked against a full
+render the first time each conversation shape (sequence of roles) is seen,
+and the renderer falls back to full renders where they differ.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+class PromptRenderer:
+    """Chat-template rendering that reuses the tokenized developer turn"""
+
+    def __init__(self, processor, max_entries=16):
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # tool set -> {"key", "prefix_ids", "shapes"}
+        self.lock = threading.Lock()
+
+    def _full(self, messages, tools):
+        return list(self.processor.apply_chat_template(
+            messages, tools=tools, add_generation_prompt=True, return_dict=True
+        )["input_ids"])
+
+    def prefix(self, messages, tools):
+        """Return (hash of the rendered developer turn, its token ids), or (None, None)"""
+        entry = self._entry(messages, tools)
+        return (entry["key"], entry["prefix_ids"]) if entry else (None, None)
+
+    def _entry(self, messages, tools):
+        if not messages or messages[0]["role"] not in ("developer", "system"):
+            return None
+        tool_set = json.dumps([messages[0], tools], sort_keys=True, default=str)
+        with self.lock:
+            entry = self.entries.get(tool_set)
+            if entry is not None:
+                self.entries.move_to_end(tool_set)
+                return entry
+
+        text = self.processor.apply_chat_template(
+            messages[:1], tools=tools, add_generation_prompt=False, tokenize=False
+        )
+        entry = {
+            "key": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "prefix_ids": list(self.processor.apply_chat_template(
+                messages[:1], tools=tools, add_generation_prompt=False, return_dict=True
+            )["input_ids"]),
+            "shapes": {}  # roles after the developer turn -> concatenation verified
+        }
+        with self.lock:
+            self.entries[tool_set] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def render(self, messages, tools):
+        """Token ids for messages + generation prompt, equal to apply_chat_template's"""
+        entry = self._entry(messages, tools)
+        if entry is None or len(messages) < 2:
+            return self._full(messages, tools)
+
+        shape = tuple(m["role"] for m in messages[1:])
+        verified = entry["shapes"].get(shape)
+        if verified is False:
+            return self._full(messages, tools)
+
+        text = self.processor.apply_chat_template(
+            messages[1:], add_generation_prompt=True, tokenize=False
+        )
+        bos = self.tokenizer.bos_token
+        if bos and text.startswith(bos):
+            text = text[len(bos):]
+        ids = entry["prefix_ids"] + self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+        if verified is None:
+            full = self._full(messages, tools)
+            entry["shapes"][shape] = full == ids
+            return full
+        return ids
@@ -0,0 +1,110 @@
+"""
+Accuracy guardrail for the int8 model.
+
+Runs the reference prompts through the full-precision and the int8
+dynamic-quantized model, each in its own process so the RSS figures don't mix,
+and reports load time, latency, RSS and call-level agreement side by side.
+
+    python quantize_check.py
+    python quantize_check.py --file prompts.txt
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+REFERENCE_PROMPTS = [
+    "Turn WiFi on", "Turn off the wifi", "Disable WiFi",
+    "Set volume to 50", "Set the volume to 100", "Volume 15 please", "Mute the volume",
+    "Open Chrome browser", "Open notepad", "Launch the calculator", "Open settings",
+    "Open Spotify and set volume to 30"
+]
+
+def _rss_mb():
+    """Resident set size in MB (peak RSS where psutil isn't installed), or None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def run_mode(quantize, prompts):
+    """Load one model variant, run the prompts and return timings and calls"""
+    from engine import DEVELOPER_PROMPT, Engine
+    from loader import load_model
+    from schemas import FUNCTIONS
+
+    start = time.perf_counter()
+    processor, model = load_model(quantize=quantize)
+    load_time = time.perf_counter() - start
+
+    engine = Engine(processor, model)
+    engine.warm_up()
+    latencies, calls = [], []
+    for prompt in prompts:
+        messages = [{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": prompt}]
+        start = time.perf_counter()
+        result = engine.complete(messages, FUNCTIONS)
+        latencies.append(time.perf_counter() - start)
+        calls.append(result["calls"])
+
+    return {"load_time": load_time, "latencies": latencies, "rss_mb": _rss_mb(), "calls": calls}
+
+def _normalise(calls):
+    return [(c["name"], {k: str(v).strip().lower() for k, v in c["arguments"].items()}) for c in calls]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the int8 model with full precision")
+    parser.add_argument("--file", help="Reference prompts, one per line (default: built-in set)")
+    parser.add_argument("--mode", choices=["full", "int8"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    else:
+        prompts = REFERENCE_PROMPTS
+
+    if args.mode:
+        # Child process: report one variant as JSON
+        print(json.dumps(run_mode(args.mode == "int8", prompts)))
+        return
+
+    results = {}
+    for mode in ("full", "int8"):
+        print(f"Running {mode} model...")
+        command = [sys.executable, __file__, "--mode", mode] + (["--file", args.file] if args.file else [])
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    full, int8 = results["full"], results["int8"]
+    agree = [_normalise(a) == _normalise(b) for a, b in zip(full["calls"], int8["calls"])]
+
+    def ms(values, q):
+        return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+    def mb(value):
+        return "-" if value is None else f"{value:.0f}"
+
+    print(f"\n{'':<16}{'full':>10}{'int8':>10}")
+    print(f"{'load (s)':<16}{full['load_time']:>10.1f}{int8['load_time']:>10.1f}")
+    print(f"{'p50 (ms)':<16}{ms(full['latencies'], 50):>10.0f}{ms(int8['latencies'], 50):>10.0f}")
+    print(f"{'p95 (ms)':<16}{ms(full['latencies'], 95):>10.0f}{ms(int8['latencies'], 95):>10.0f}")
+    print(f"{'RSS (MB)':<16}{mb(full['rss_mb']):>10}{mb(int8['rss_mb']):>10}")
+    print(f"\nCall agreement: {sum(agree)}/{len(agree)} ({sum(agree) / len(agree):.0%})")
+    for prompt, same, a, b in zip(prompts, agree, full["calls"], int8["calls"]):
+        if not same:
+            print(f"  {prompt!r}\n    full: {a}\n    int8: {b}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Readiness polling for the desktop actions.
+
+Rather than sleeping a fixed time and hoping the UI has caught up, actions
+poll for the condition they actually need (a launched app's window taking
+focus) with a bounded exponential backoff. Polling is async, so a waiting
+action doesn't hold a thread while other calls and sessions make progress.
+"""
+
+import sys
+
+LAUNCH_TIMEOUT = 8.0
+
+async def until(predicate, timeout=5.0, interval=0.02, max_interval=0.25):
+    """Poll predicate with exponential backoff; return whether it held before the timeout"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        if predicate():
+            return True
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+def foreground_window():
+    """Handle of the focused window, or None where it can't be queried"""
+    if sys.platform == "win32":
+        import ctypes
+        return ctypes.windll.user32.GetForegroundWindow()
+    return None
+
+async def window_ready(process, before, timeout=LAUNCH_TIMEOUT):
+    """Wait until a newly launched app's window has taken focus
+
+    before is the foreground window from just before the launch. Launcher
+    stubs (calc.exe, chrome.exe with a running instance) exit immediately and
+    hand off to another process, so the focus change is what's watched, not
+    the process itself.
+    """
+    if before is None:
+        # Focus can't be observed on this platform
+        return process.poll() in (None, 0)
+    return await until(lambda: foreground_window() not in (before, 0), timeout)
@@ -0,0 +1,307 @@
+"""
+Tool registry.
+
+Tools are plain functions registered with @registry.tool. Each tool's JSON
+schema is built once at registration from its signature and docstring
+(Literal[...] hints become enums; extra keywords such as minimum/maximum can
+be merged in per parameter), argument coercion is precompiled from the schema
+types, and calls are dispatched through a dict.
+
+    registry = ToolRegistry()
+
+    @registry.tool(parameters={"level": {"minimum": 0, "maximum": 100}})
+    def set_volume(level: int):
+        ...
+
+ToolExecutor runs the calls of one assistant turn concurrently. Tools that
+share a concurrency class (e.g. "input" for keyboard/mouse) run one at a time
+in the order they were emitted; tools without one run in parallel. A tool can
+also wait for earlier calls of the tools or classes named in after (typing
+waits for an app launched just before it). A tool's timeout bounds how long
+its result is waited for, and results are returned in the original call order;
+a call that timed out still holds its concurrency class until it returns.
+
+Tools may be async functions: they run on one shared event loop, so a tool
+that is waiting (polling for readiness, sleeping) doesn't hold a thread.
+"""
+
+import inspect
+import re
+import threading
+import time
+import typing
+
+import metrics
+
+# asyncio and concurrent.futures are imported where they are first needed,
+# so registering tools (at import of every entry point) stays cheap
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def event_loop():
+    """The background event loop async tools run on, started on first use"""
+    global _loop
+    import asyncio
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tool-loop", daemon=True).start()
+    return _loop
+
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+def _coerce_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+COERCERS = {
+    "string": lambda v: str(v).strip(),
+    "integer": lambda v: int(float(v)) if isinstance(v, str) else int(v),
+    "number": float,
+    "boolean": _coerce_bool
+}
+
+def _parse_docstring(doc):
+    """Split a Google-style docstring into (description, {arg: description})"""
+    doc = inspect.cleandoc(doc or "")
+    parts = re.split(r"^\s*Args:\s*$", doc, maxsplit=1, flags=re.MULTILINE)
+    description = " ".join(parts[0].split())
+    args = {}
+    if len(parts) > 1:
+        for name, text in re.findall(r"^\s*(\w+)\s*(?:\([^)]*\))?:\s*(.+)$", parts[1], re.MULTILINE):
+            args[name] = text.strip()
+    return description, args
+
+def _param_schema(annotation):
+    if typing.get_origin(annotation) is typing.Union:
+        # Optional[int] and friends
+        annotation = next(a for a in typing.get_args(annotation) if a is not type(None))
+    if typing.get_origin(annotation) is typing.Literal:
+        values = list(typing.get_args(annotation))
+        return {"type": JSON_TYPES.get(type(values[0]), "string"), "enum": values}
+    return {"type": JSON_TYPES.get(annotation, "string")}
+
+def build_schema(func, name=None, description=None, parameters=None):
+    """Derive a function-calling JSON schema from a function's signature and docstring"""
+    doc_description, arg_docs = _parse_docstring(func.__doc__)
+    hints = typing.get_type_hints(func)
+    properties, required = {}, []
+    for param in inspect.signature(func).parameters.values():
+        schema = _param_schema(hints.get(param.name, str))
+        if param.name in arg_docs:
+            # Description right after the type, as in hand-written schemas
+            schema = {"type": schema.pop("type"), "description": arg_docs[param.name], **schema}
+        schema.update((parameters or {}).get(param.name, {}))
+        properties[param.name] = schema
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+
+    parameters_schema = {"type": "object", "properties": properties}
+    if required:
+        parameters_schema["required"] = required
+    return {
+        "type": "function",
+        "function": {
+            "name": name or func.__name__,
+            "description": description or doc_description,
+            "parameters": parameters_schema
+        }
+    }
+
+class Tool:
+    """A registered function with its schema and precompiled argument coercion"""
+
+    def __init__(self, func, schema, concurrency=None, timeout=None, after=()):
+        self.func = func
+        self.schema = schema
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.after = set(after)
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.name = schema["function"]["name"]
+        properties = schema["function"]["parameters"].get("properties", {})
+        self.coercers = {arg: COERCERS[spec.get("type", "string")] for arg, spec in properties.items()}
+
+    def __call__(self, arguments):
+        with metrics.timer("tool", tool=self.name):
+            result = self.invoke(arguments)
+            if self.is_async:
+                import asyncio
+                return asyncio.run_coroutine_threadsafe(result, event_loop()).result()
+            return result
+
+    def invoke(self, arguments):
+        """Call the function with coerced arguments (a coroutine for async tools)"""
+        args = {}
+        for key, value in arguments.items():
+            coerce = self.coercers.get(key)
+            if coerce is None:
+                # Unknown argument names are left for the function to reject
+                args[key] = value
+                continue
+            try:
+                args[key] = coerce(value)
+            except (TypeError, ValueError):
+                args[key] = value
+        return self.func(**args)
+
+class ToolRegistry:
+    """Name -> Tool mapping with cached schema lists per tool subset"""
+
+    def __init__(self):
+        self.tools = {}
+        self.version = 0
+        self._schemas = {}
+
+    def tool(self, func=None, *, name=None, description=None, parameters=None,
+             concurrency=None, timeout=None, after=()):
+        """Decorator registering a function as a tool
+
+        Tools with the same concurrency class never run at the same time, and
+        a tool starts only after earlier calls of the tools/classes in after;
+        timeout is in seconds (None waits for the result indefinitely).
+        """
+        def register(func):
+            schema = build_schema(func, name, description, parameters)
+            tool = Tool(func, schema, concurrency, timeout, after)
+            self.tools[tool.name] = tool
+            self.version += 1
+            self._schemas.clear()
+            return func
+        return register(func) if func is not None else register
+
+    def schemas(self, names=None, docstrings=None):
+        """JSON schemas for the named tools (all tools by default), built once per version
+
+        docstrings maps tool names to a docstring that replaces the function's
+        own for this list, for callers whose prompt describes a tool differently.
+        """
+        key = (tuple(names) if names is not None else None, tuple(sorted((docstrings or {}).items())))
+        if key not in self._schemas:
+            selected = names if names is not None else list(self.tools)
+            self._schemas[key] = [self._schema(n, (docstrings or {}).get(n)) for n in selected]
+        return self._schemas[key]
+
+    def _schema(self, name, docstring=None):
+        schema = self.tools[name].schema
+        if docstring is None:
+            return schema
+        description, arg_docs = _parse_docstring(docstring)
+        function = dict(schema["function"], description=description)
+        properties = {}
+        for arg, spec in function["parameters"]["properties"].items():
+            spec = dict(spec)
+            if arg in arg_docs:
+                spec["description"] = arg_docs[arg]
+            properties[arg] = spec
+        function["parameters"] = dict(function["parameters"], properties=properties)
+        return dict(schema, function=function)
+
+    def __contains__(self, name):
+        return name in self.tools
+
+    def dispatch(self, function_call):
+        """Run {"name", "arguments"} through the registered tool"""
+        tool = self.tools.get(function_call["name"])
+        if tool is None:
+            raise KeyError(function_call["name"])
+        return tool(function_call.get("arguments", {}))
+
+class _Pending:
+    """One submitted call: its future plus when it started and must finish by"""
+
+    def __init__(self, call, tool):
+        self.call = call
+        self.tool = tool
+        self.started = threading.Event()
+        self.deadline = None
+        self.future = None
+
+    def release(self, finished=False):
+        """Wait until the call finished or ran past its timeout (or, if finished, until it finished)"""
+        from concurrent.futures import wait
+        self.started.wait()
+        remaining = None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+        wait([self.future], timeout=None if finished else remaining)
+
+class ToolExecutor:
+    """Runs tool calls on a thread pool, serializing calls within a concurrency class"""
+
+    def __init__(self, registry, max_workers=8, names=None):
+        self.registry = registry
+        self.names = set(names) if names is not None else None
+        self.max_workers = max_workers
+        self.pool = None  # created on the first call
+        self.lock = threading.Lock()
+        self.running = []  # submitted calls that haven't finished
+
+    def submit(self, function_call):
+        """Start a call; pass the returned handle to result()"""
+        name = function_call["name"]
+        tool = self.registry.tools.get(name)
+        if self.names is not None and name not in self.names:
+            tool = None
+        pending = _Pending(function_call, tool)
+        if tool is None:
+            pending.started.set()
+            return pending
+
+        with self.lock:
+            self.running = [p for p in self.running if not p.future.done()]
+            previous = [p for p in self.running if self._waits_for(tool, p.tool)]
+            self.running.append(pending)
+            if tool.is_async and not previous:
+                import asyncio
+                pending.future = asyncio.run_coroutine_threadsafe(self._run_async(pending), event_loop())
+            else:
+                if self.pool is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+                pending.future = self.pool.submit(self._run, pending, previous)
+        return pending
+
+    @staticmethod
+    def _waits_for(tool, earlier):
+        if tool.concurrency and earlier.concurrency == tool.concurrency:
+            return True
+        return earlier.name in tool.after or (earlier.concurrency is not None and earlier.concurrency in tool.after)
+
+    def _start(self, pending):
+        if pending.tool.timeout is not None:
+            pending.deadline = time.monotonic() + pending.tool.timeout
+        pending.started.set()
+        return pending.call.get("arguments", {})
+
+    def _run(self, pending, previous):
+        for earlier in previous:
+            # A timed-out call still holds its concurrency class until its
+            # thread actually returns; an "after" dependency only waits for its timeout
+            same_class = pending.tool.concurrency and earlier.tool.concurrency == pending.tool.concurrency
+            earlier.release(finished=bool(same_class))
+        return pending.tool(self._start(pending))
+
+    async def _run_async(self, pending):
+        with metrics.timer("tool", tool=pending.tool.name):
+            return await pending.tool.invoke(self._start(pending))
+
+    def result(self, pending):
+        """The call's tool response, or an error response if it failed or timed out"""
+        name = pending.call["name"]
+        if pending.tool is None:
+            return {"status": "error", "message": f"Unknown function: {name}"}
+        pending.release()
+        if not pending.future.done():
+            # Async tools are cancelled; a thread can't be interrupted and finishes in the background
+            pending.future.cancel()
+            return {"status": "error", "message": f"{name} timed out after {pending.tool.timeout}s"}
+        try:
+            return pending.future.result()
+        except Exception as e:
+            return {"status": "error", "message": f"{name} failed: {e}"}
+
+    def run(self, function_calls):
+        """Run a turn's calls concurrently and return their results in call order"""
+        pending = [self.submit(call) for call in function_calls]
+        return [self.result(p) for p in pending]
@@ -0,0 +1,123 @@
+"""
+Response cache for repeated single-turn commands.
+
+A handful of utterances ("Turn WiFi on", "Set volume to 50") make up most
+traffic, so completions are cached by normalized utterance + a hash of the
+developer prompt and tool set. The in-memory LRU expires entries after a TTL;
+an optional SQLite file keeps them across restarts. Identical requests that
+arrive while one is already generating wait for that generation instead of
+starting their own.
+
+Normalization only collapses whitespace and trailing punctuation. Case is
+kept because arguments like type_text's text are copied verbatim.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class ResponseCache:
+    """In-memory LRU + optional SQLite tier, with request coalescing"""
+
+    def __init__(self, max_entries=1024, ttl=3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.in_flight = {}           # key -> Future
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self.db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self.db.commit()
+
+    @staticmethod
+    def normalize(utterance):
+        return re.sub(r"\s+", " ", utterance).strip().rstrip(".!?").strip()
+
+    def key(self, messages, tools):
+        """Cache key for a [developer, user] conversation, or None if it isn't one"""
+        if len(messages) != 2 or messages[-1]["role"] != "user":
+            return None
+        prefix = json.dumps([messages[0], tools], sort_keys=True, default=str)
+        text = self.normalize(messages[-1]["content"]) + "\0" + prefix
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            self.entries.pop(key, None)
+            if self.db is None:
+                return None
+            row = self.db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row and row[1] > now:
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            return value
+        return None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.db is not None:
+            with self.lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, json.dumps(value), expires_at)
+                )
+                self.db.commit()
+
+    def _remember(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, or compute it once however many callers ask"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return dict(value, cached=True)
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return dict(future.result(), cached=True)
+
+        try:
+            value = compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
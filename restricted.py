@@ -0,0 +1,203 @@
+"""
+Vocabulary-restricted output head.
+
+FunctionGemma keeps Gemma's 262k-token vocabulary, so the output projection
+(hidden state x embedding matrix) costs more per decoded token than the
+transformer layers of the 270M model. Inside a call the model only needs a
+small part of it: call syntax, tool and argument names, enum values, digits
+and tokens copied from the prompt.
+
+RestrictedDecoder builds that allowed set per request from the active tool
+schemas and the prompt, and inside a call computes logits for those rows of
+the output embedding only. It falls back to the full head:
+
+    - outside a call (the first token, between calls, plain-text answers),
+      where anything may come next;
+    - inside a string value, for any step where the restricted choice is
+      unsure (top probability under the restricted softmax below
+      CONFIDENCE), which is where a token outside the set would be wanted.
+
+Decoding is greedy. Tool names outside the set can't be produced, so a
+confused model is held to the declared tools, as in constrained mode.
+
+    python restricted.py        # agreement with the full head, latency, set sizes
+"""
+
+import re
+
+import torch
+from transformers import DynamicCache
+
+from stopping import MAX_BUDGET, CallStops, DecodeLoop, Totals
+
+ESCAPE = "<escape>"
+CONTROL_TOKENS = ("<start_function_call>", "<end_function_call>", ESCAPE, "<end_of_turn>")
+SYNTAX = ("call:", "{", "}", ",", ":", "[", "]", "true", "false", "null")
+CONFIDENCE = 0.5
+
+class RestrictedDecoder:
+    """Greedy decoding with logits computed only for the tokens a call can use"""
+
+    def __init__(self, processor, model, prefix_cache=None, confidence=CONFIDENCE):
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        self.decoder = model.get_decoder()
+        self.head = model.get_output_embeddings()
+        self.softcap = getattr(model.config, "final_logit_softcapping", None)
+        self.prefix_cache = prefix_cache
+        self.confidence = confidence
+
+        self.stops = CallStops(self.tokenizer, model)
+        self.escape_id = self.tokenizer.convert_tokens_to_ids(ESCAPE)
+        # Always allowed: markers, call syntax and every single-character ASCII
+        # token (digits, punctuation, and letters to spell what isn't copied)
+        self.base = set(self.stops.eos_ids)
+        for token in CONTROL_TOKENS:
+            token_id = self.tokenizer.convert_tokens_to_ids(token)
+            if token_id != self.tokenizer.unk_token_id:
+                self.base.add(token_id)
+        for text in SYNTAX:
+            self.base.update(self.encode(text))
+        texts = self.tokenizer.batch_decode([[i] for i in range(len(self.tokenizer))])
+        self.base.update(i for i, text in enumerate(texts) if len(text.strip()) == 1 and text.isascii())
+        self._tools = {}  # id(tools) -> (tools, token ids)
+        self.stats = Totals("restricted", "full", "allowed", "requests")
+
+    def encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def _variants(self, text):
+        """Token ids of text as it may appear after ':', '<escape>' or a space, in common casings"""
+        ids = set()
+        for form in {text, text.lower(), text.capitalize(), text.title()}:
+            ids.update(self.encode(form))
+            ids.update(self.encode(" " + form))
+        return ids
+
+    def _tool_ids(self, tools):
+        # Keyed by identity: registries hand out the same schema list every time
+        cached = self._tools.get(id(tools))
+        if cached is not None and cached[0] is tools:
+            return cached[1]
+        ids = set()
+        for tool in tools or ():
+            function = tool.get("function", tool)
+            ids.update(self.encode(f"call:{function['name']}{{"))
+            ids.update(self._variants(function["name"]))
+            for name, schema in function.get("parameters", {}).get("properties", {}).items():
+                ids.update(self.encode(f"{name}:"))
+                ids.update(self._variants(name))
+                for value in schema.get("enum", ()):
+                    ids.update(self._variants(str(value)))
+        if len(self._tools) > 16:
+            self._tools.clear()
+        self._tools[id(tools)] = (tools, ids)
+        return ids
+
+    def allowed(self, input_ids, messages, tools):
+        """Sorted tensor of the token ids a call for this request may use"""
+        ids = self.base | self._tool_ids(tools) | set(input_ids)
+        # Words of the user's text, tokenized as they'd be copied into a value
+        for message in messages:
+            if message["role"] == "user" and isinstance(message.get("content"), str):
+                for word in re.findall(r"\w+|[^\w\s]", message["content"]):
+                    ids.update(self._variants(word))
+        return torch.tensor(sorted(ids), device=self.head.weight.device)
+
+    def _capped(self, logits):
+        if self.softcap:
+            logits = torch.tanh(logits / self.softcap) * self.softcap
+        return logits
+
+    @torch.no_grad()
+    def generate(self, input_ids, messages, tools, max_new_tokens=MAX_BUDGET, max_calls=1, streamer=None):
+        """Decode a prompt (list of token ids) greedily and return the generated ids"""
+        input_ids = list(input_ids)
+        allowed = self.allowed(input_ids, messages, tools)
+        weight = self.head.weight.index_select(0, allowed)
+        bias = self.head.bias.index_select(0, allowed) if self.head.bias is not None else None
+
+        cache, cached = None, 0
+        if self.prefix_cache:
+            cache, cached = self.prefix_cache.match(input_ids)
+        if cache is None:
+            cache, cached = DynamicCache(config=self.model.config), 0
+
+        device = self.model.device
+        ids = input_ids[cached:]
+        in_call = in_string = False
+        restricted = full = 0
+        loop = DecodeLoop(self.stops, input_ids, max_new_tokens, max_calls, streamer)
+        while True:
+            hidden = self.decoder(
+                input_ids=torch.tensor([ids], device=device), past_key_values=cache, use_cache=True
+            ).last_hidden_state[0, -1]
+
+            token = None
+            if in_call:
+                logits = self._capped(torch.nn.functional.linear(hidden, weight, bias))
+                best = int(logits.argmax())
+                if not in_string or torch.softmax(logits.float(), -1)[best] >= self.confidence:
+                    token = int(allowed[best])
+                    restricted += 1
+            if token is None:
+                token = int(self._capped(self.head(hidden)).argmax())
+                full += 1
+
+            if loop.emit([token]):
+                break
+            if token == self.stops.start_id:
+                in_call, in_string = True, False
+            elif token == self.stops.end_id:
+                in_call = False
+            elif token == self.escape_id and in_call:
+                in_string = not in_string
+            ids = [token]
+
+        self.stats.add(restricted=restricted, full=full, allowed=len(allowed), requests=1)
+        return loop.finish()
+
+def main():
+    import argparse
+    from benchmarks.decoders import compare, greedy, load_engine, report
+    from parsing import extract_tool_calls
+    from schemas import FUNCTIONS
+
+    parser = argparse.ArgumentParser(description="Compare the restricted output head with the full head")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help="Restricted top probability below which string steps use the full head")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per prompt (fastest kept)")
+    args = parser.parse_args()
+
+    engine = load_engine()
+    decoder = RestrictedDecoder(engine.processor, engine.model, confidence=args.confidence)
+    modes = {
+        "full": greedy(engine),
+        "restricted": lambda messages, input_ids, max_new_tokens: decoder.generate(
+            input_ids, messages, FUNCTIONS, max_new_tokens
+        )
+    }
+
+    def calls(ids):
+        return extract_tool_calls(engine.processor.decode(ids, skip_special_tokens=True), FUNCTIONS)
+
+    results, matches = [], 0
+    print(f"{'prompt':<50}{'tokens':>7}{'full ms':>9}{'restr ms':>10}{'same':>6}")
+    for prompt, outputs, timings in compare(engine, modes, repeat=args.repeat):
+        results.append((prompt, outputs, timings))
+        same = calls(outputs["full"]) == calls(outputs["restricted"])
+        matches += same
+        print(f"{prompt[:48]:<50}{len(outputs['restricted']):>7}{timings['full'] * 1000:>9.1f}"
+              f"{timings['restricted'] * 1000:>10.1f}{'yes' if same else 'NO':>6}")
+
+    stats = decoder.stats
+    steps = stats["restricted"] + stats["full"]
+    print(f"\nAllowed tokens per request: {stats['allowed'] / stats['requests']:.0f} "
+          f"of {engine.model.get_output_embeddings().weight.shape[0]}")
+    print(f"Restricted steps: {stats['restricted'] / max(steps, 1):.1%} (the rest used the full head)")
+    report(results)
+    print(f"Same calls as the full head: {matches}/{len(results)}")
+
+if __name__ == "__main__":
+    main()
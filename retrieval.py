@@ -0,0 +1,221 @@
+"""
+Per-query tool retrieval.
+
+Every tool declaration in the prompt has to be prefilled, so prompt length
+(and prefill time) grows with the tool catalogue even though a command needs
+one or two tools. ToolRetriever indexes each tool set once as a TF-IDF matrix
+over the tool names, descriptions, parameter names/descriptions and enum
+values (words plus character 3/4-grams, so "typing" still finds type_text)
+and keeps only the k best-scoring tools for a query. Selected tools keep
+their catalogue order, so the same selection always renders the same prompt
+prefix. A query whose best match scores below min_score (it shares little or
+nothing with any tool) gets the whole catalogue instead of a guess.
+
+Catalogues smaller than min_tools are sent whole. Their prompt is short, and
+its developer turn is prefilled once and reused from the prefix cache; the
+subsets picked for different queries would each need their own cache entry,
+and a handful of them is enough to evict each other.
+
+    python retrieval.py                    # recall and prompt size vs k
+    python retrieval.py --file labelled.tsv --tokens
+"""
+
+import json
+import re
+import threading
+
+import numpy as np
+
+# Smaller catalogues are always sent whole
+MIN_TOOLS = 16
+
+# Words too common in commands and descriptions to say anything about the tool
+STOP_WORDS = {
+    "a", "an", "the", "to", "of", "or", "and", "for", "at", "in", "on", "by", "with", "is", "it",
+    "this", "that", "e", "g", "please", "can", "you", "i", "m", "s", "all", "my", "me"
+}
+
+def _terms(text):
+    """Word and character n-gram terms of a piece of text"""
+    words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS]
+    terms = list(words)
+    padded = f" {' '.join(words)} "
+    for n in (3, 4):
+        terms += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+    return terms
+
+def _document(tool):
+    """Searchable text of one tool schema"""
+    function = tool.get("function", tool)
+    parts = [function["name"].replace("_", " "), function.get("description", "")]
+    for name, schema in function.get("parameters", {}).get("properties", {}).items():
+        parts += [name.replace("_", " "), schema.get("description", "")]
+        parts += [str(v) for v in schema.get("enum", [])]
+    return " ".join(parts)
+
+class ToolIndex:
+    """TF-IDF matrix over one tool set"""
+
+    def __init__(self, tools):
+        self.tools = list(tools)
+        documents = [_terms(_document(tool)) for tool in self.tools]
+        self.vocabulary = {}
+        for terms in documents:
+            for term in terms:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+
+        counts = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for term in terms:
+                counts[row, self.vocabulary[term]] += 1.0
+        # Smoothed idf: terms shared by every tool still count a little
+        frequency = (counts > 0).sum(axis=0)
+        self.idf = np.log((1 + len(documents)) / (1 + frequency)).astype(np.float32) + 1.0
+        self.matrix = self._normalise(counts * self.idf)
+
+    @staticmethod
+    def _normalise(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    def scores(self, query):
+        """Cosine similarity of the query to every tool"""
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term in _terms(query):
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] += 1.0
+        return self.matrix @ self._normalise(vector * self.idf)
+
+    def select(self, query, k, min_score=0.0):
+        """The k best-matching tools in catalogue order, or every tool if none scores min_score"""
+        if k <= 0 or k >= len(self.tools):
+            return self.tools
+        scores = self.scores(query)
+        if not scores.any() or scores.max() < min_score:
+            return self.tools
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [self.tools[i] for i in sorted(top)]
+
+class ToolRetriever:
+    """Narrows a tool catalogue to the k tools most relevant to a query"""
+
+    def __init__(self, k=4, min_score=0.1, max_entries=16, min_tools=MIN_TOOLS):
+        self.k = k
+        self.min_score = min_score
+        self.min_tools = min_tools
+        self.max_entries = max_entries
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.selections = 0
+        self.dropped_tools = 0
+
+    def index(self, tools):
+        """Return the (cached) index for a tool set"""
+        key = json.dumps(tools, sort_keys=True, default=str)
+        with self.lock:
+            index = self.indexes.get(key)
+        if index is None:
+            index = ToolIndex(tools)
+            with self.lock:
+                if len(self.indexes) >= self.max_entries:
+                    self.indexes.pop(next(iter(self.indexes)))
+                self.indexes[key] = index
+        return index
+
+    def select(self, query, tools, k=None):
+        """Return the subset of tools to put in the prompt for this query"""
+        k = self.k if k is None else k
+        if not tools or len(tools) <= k or len(tools) < self.min_tools:
+            return tools
+        selected = self.index(tools).select(query, k, self.min_score)
+        self.selections += 1
+        self.dropped_tools += len(tools) - len(selected)
+        return selected
+
+def recall_at_k(retriever, samples, tools, ks):
+    """Per k: fraction of the narrowed (query, expected tool) samples whose tool
+    survives selection, and fraction that fell back to the whole catalogue
+
+    A fallback always contains the expected tool, so fallbacks are left out of
+    recall; a k with no narrowed samples has a recall of None.
+    """
+    index = retriever.index(tools)
+    report = []
+    for k in ks:
+        found = fallbacks = 0
+        for query, expected in samples:
+            selected = index.select(query, k, retriever.min_score)
+            if k < len(tools) and len(selected) == len(tools):
+                fallbacks += 1
+            else:
+                found += expected in [tool["function"]["name"] for tool in selected]
+        narrowed = len(samples) - fallbacks
+        report.append({
+            "k": k, "recall": found / narrowed if narrowed else None,
+            "fallback": fallbacks / (len(samples) or 1)
+        })
+    return report
+
+def main():
+    import argparse
+    from actions import registry
+    from engine import DEVELOPER_PROMPT
+
+    parser = argparse.ArgumentParser(description="Tool retrieval recall and prompt size for each k")
+    parser.add_argument("--file", help="Tab-separated 'utterance<TAB>expected tool' lines (default: built-in samples)")
+    parser.add_argument("--tokens", action="store_true", help="Also report mean prompt tokens (loads the processor)")
+    parser.add_argument("--target", type=float, default=1.0, help="Recall the suggested k must reach")
+    parser.add_argument("--min-score", type=float, default=0.1,
+                        help="Below this best score the whole catalogue is used")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            samples = [tuple(line.rstrip("\n").split("\t")[:2]) for line in f if "\t" in line]
+    else:
+        samples = [
+            ("Open notepad", "open_app"), ("Launch the calculator", "open_app"),
+            ("open chrome", "open_app"), ("Start paint", "open_app"),
+            ("Type Hello World", "type_text"), ("write 'good morning'", "type_text"),
+            ("Press enter", "press_key"), ("hit ctrl+s", "press_key"), ("alt+f4", "press_key"),
+            ("Click the mouse", "click_mouse"), ("click at 200, 300", "click_mouse"),
+            ("Set volume to 50", "set_volume"), ("turn the sound down to 10", "set_volume"),
+            ("Wait 5 seconds", "wait"), ("pause for a second", "wait"),
+            ("Search for Python tutorials", "search_web"), ("google the weather", "search_web"),
+            ("look up flights to Paris", "search_web"), ("I'm finished", "task_done"),
+            ("that's all, the task is complete", "task_done")
+        ]
+
+    tools = registry.schemas()
+    retriever = ToolRetriever(min_score=args.min_score)
+    ks = range(1, len(tools) + 1)
+    report = recall_at_k(retriever, samples, tools, ks)
+
+    renderer = None
+    if args.tokens:
+        from transformers import AutoProcessor
+        from model_store import resolve
+        from prompt import PromptRenderer
+        renderer = PromptRenderer(AutoProcessor.from_pretrained(resolve(), local_files_only=True))
+
+    print(f"{'k':>3}  {'recall':>7}  {'fallback':>8}" + (f"  {'prompt tokens':>13}" if renderer else ""))
+    for row in report:
+        recall = f"{row['recall']:.0%}" if row["recall"] is not None else "-"
+        line = f"{row['k']:>3}  {recall:>7}  {row['fallback']:>8.0%}"
+        if renderer:
+            lengths = []
+            for query, _ in samples:
+                messages = [{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": query}]
+                selected = retriever.index(tools).select(query, row["k"], args.min_score)
+                lengths.append(len(renderer.render(messages, selected)))
+            line += f"  {sum(lengths) / len(lengths):>13.0f}"
+        print(line)
+
+    safe = next((row["k"] for row in report if (row["recall"] or 0) >= args.target), len(tools))
+    print(f"\nSmallest k with recall >= {args.target:.0%} (fallbacks excluded): {safe}")
+    if len(tools) < retriever.min_tools:
+        print(f"The catalogue has fewer than {retriever.min_tools} tools, so it is sent whole")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Pre-model intent router.
+
+Trivial commands ("set volume to 50", "turn wifi off") don't need a
+transformer forward pass. IntentRouter builds, per tool set, a hashed n-gram
+classifier from the tool schemas alone (names, descriptions, parameter
+descriptions and enum values) and argument extractors from the parameter
+types. A command is answered directly only when the classifier is confident
+and every required argument was extracted; everything else falls through to
+the model. Commands that may hold more than one action or a negation ("open
+chrome and search for cats", "don't turn wifi on"), or that mention another
+tool's verb, are always left to the model. The only free-text arguments
+taken are names (app_name and the like): a few words after a leading verb
+("open notepad", not "type open sesame" or "open a new tab in chrome").
+Verbatim text such as type_text's text or search_web's query is never
+guessed at, so those tools always go to the model.
+
+    python router.py                       # hit rate / accuracy vs the model
+    python router.py --file utterances.txt
+"""
+
+import hashlib
+import json
+import re
+
+import numpy as np
+
+FEATURES = 1 << 12
+# Words that trail an app/site name but aren't part of it
+FILLER = {"the", "a", "an", "for", "up", "to", "please", "app", "application", "program", "browser", "now"}
+# A name containing one of these is a phrase, not a name ("a new tab in chrome")
+PHRASE_WORDS = FILLER | {"in", "on", "of", "with", "into", "at", "from", "by", "my", "new"}
+MAX_NAME_WORDS = 3
+# Words that may join or negate actions; the router never guesses at those
+CONJUNCTIONS = {"and", "then", "also", "after", "afterwards", "before", "plus", "while", "or"}
+NEGATIONS = {"not", "no", "never", "don't", "dont", "doesn't", "didn't", "without", "stop"}
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower().replace("\u2019", "'"))
+
+def _ambiguous(words):
+    """True if the words may join several actions or negate one"""
+    return any(w in CONJUNCTIONS or w in NEGATIONS or w.endswith("n't") for w in words)
+
+def _features(text):
+    """L2-normalised hashed word + character n-gram vector"""
+    text = text.lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    grams = list(words)
+    padded = f" {' '.join(words)} "
+    for n in (3, 4):
+        grams += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+    vector = np.zeros(FEATURES, dtype=np.float32)
+    for gram in grams:
+        digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest, "little") % FEATURES] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class _CompiledTools:
+    """Classifier prototypes and argument extractors for one tool set"""
+
+    def __init__(self, tools):
+        self.functions = [tool.get("function", tool) for tool in tools]
+        rows = []
+        self.triggers = []
+        for function in self.functions:
+            name_words = function["name"].replace("_", " ")
+            parameters = function.get("parameters", {}).get("properties", {})
+            phrases = [name_words, function.get("description", "")]
+            for param, schema in parameters.items():
+                phrases.append(f"{name_words} {param.replace('_', ' ')} {schema.get('description', '')}")
+                for value in schema.get("enum", []):
+                    phrases.append(f"{name_words} {value}")
+            prototype = np.sum([_features(p) for p in phrases], axis=0)
+            rows.append(prototype / np.linalg.norm(prototype))
+            # Verbs that introduce a free-text argument ("open", "type", "search")
+            verbs = {name_words.split()[0], function.get("description", name_words).split()[0].lower()}
+            self.triggers.append(verbs)
+        self.prototypes = np.stack(rows) if rows else np.zeros((0, FEATURES), dtype=np.float32)
+
+    def mentioned(self, words):
+        """Indices of the tools whose trigger verbs appear in the words"""
+        return {i for i, verbs in enumerate(self.triggers) if verbs & set(words)}
+
+    def classify(self, utterance):
+        """Return (index, score, margin) of the best matching tool"""
+        if not len(self.prototypes):
+            return None, 0.0, 0.0
+        scores = self.prototypes @ _features(utterance)
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        second = float(scores[order[1]]) if len(order) > 1 else 0.0
+        return int(order[0]), best, best - second
+
+    def extract(self, index, utterance):
+        """Extract every argument of the tool, or None if a required one is missing"""
+        function = self.functions[index]
+        parameters = function.get("parameters", {})
+        required = set(parameters.get("required", []))
+        arguments = {}
+        for param, schema in parameters.get("properties", {}).items():
+            value = self._extract_value(index, param, schema, utterance)
+            if value is None:
+                if param in required:
+                    return None
+                continue
+            arguments[param] = value
+        return arguments
+
+    @staticmethod
+    def _is_name(param):
+        return param == "name" or param.endswith("_name")
+
+    def _extract_value(self, index, param, schema, utterance):
+        lowered = utterance.lower()
+        if "enum" in schema:
+            found = [v for v in schema["enum"] if re.search(rf"\b{re.escape(str(v).lower())}\b", lowered)]
+            return found[0] if len(found) == 1 else None
+
+        kind = schema.get("type", "string")
+        if kind in ("integer", "number"):
+            numbers = re.findall(r"-?\d+(?:\.\d+)?", utterance)
+            if len(numbers) != 1:
+                return None
+            value = float(numbers[0]) if kind == "number" else int(float(numbers[0]))
+            if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+                return None
+            return value
+
+        # Free text is only taken for names; verbatim text is the model's job
+        if kind == "string" and self._is_name(param):
+            words = utterance.strip().rstrip(".!?").split()
+            while words and words[0].lower() in FILLER:
+                words = words[1:]
+            # The text follows the leading verb ("open notepad"), never a verb inside it
+            if not words or words[0].lower() not in self.triggers[index]:
+                return None
+            rest = words[1:]
+            while rest and rest[0].lower() in FILLER:
+                rest = rest[1:]
+            while rest and rest[-1].lower() in FILLER:
+                rest = rest[:-1]
+            if not rest or len(rest) > MAX_NAME_WORDS or any(w.lower() in PHRASE_WORDS for w in rest):
+                return None
+            return " ".join(rest).strip("\"'")
+        return None
+
+class IntentRouter:
+    """Answers high-confidence trivial commands without the model"""
+
+    def __init__(self, threshold=0.3, min_margin=0.05):
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.compiled = {}
+        self.attempts = 0
+        self.hits = 0
+
+    def _compile(self, tools):
+        key = json.dumps(tools, sort_keys=True, default=str)
+        if key not in self.compiled:
+            self.compiled[key] = _CompiledTools(tools)
+        return self.compiled[key]
+
+    def score(self, utterance, tools):
+        """Return (call or None, score, margin) without applying the thresholds"""
+        compiled = self._compile(tools)
+        index, score, margin = compiled.classify(utterance)
+        if index is None:
+            return None, 0.0, 0.0
+        words = _words(utterance)
+        mentioned = compiled.mentioned(words)
+        # Several actions, a negation, or another tool's verb: leave it to the model
+        if _ambiguous(words) or len(mentioned) > 1 or (mentioned and index not in mentioned):
+            return None, score, margin
+        arguments = compiled.extract(index, utterance)
+        if arguments is None:
+            return None, score, margin
+        return {"name": compiled.functions[index]["name"], "arguments": arguments}, score, margin
+
+    def route(self, utterance, tools):
+        """Return a call for the utterance if it is confidently trivial, else None"""
+        self.attempts += 1
+        call, score, margin = self.score(utterance, tools)
+        if call is None or score < self.threshold or margin < self.min_margin:
+            return None
+        self.hits += 1
+        return call
+
+def _same_call(a, b):
+    def norm(call):
+        args = {k: str(v).strip().lower() for k, v in call["arguments"].items()}
+        return call["name"], args
+    return a is not None and b is not None and norm(a) == norm(b)
+
+def evaluate(router, utterances, tools, model_calls, thresholds):
+    """Hit rate and accuracy (agreement with the model's call) per threshold"""
+    scored = [router.score(u, tools) for u in utterances]
+    report = []
+    for threshold in thresholds:
+        hits = correct = 0
+        for (call, score, margin), expected in zip(scored, model_calls):
+            if call is None or score < threshold or margin < router.min_margin:
+                continue
+            hits += 1
+            correct += _same_call(call, expected)
+        report.append({
+            "threshold": threshold,
+            "hit_rate": hits / len(utterances) if utterances else 0.0,
+            "accuracy": correct / hits if hits else None
+        })
+    return report
+
+def main():
+    import argparse
+    from engine import DEVELOPER_PROMPT, Engine
+    from loader import load_model
+    from schemas import FUNCTIONS
+
+    parser = argparse.ArgumentParser(description="Router hit rate and accuracy against the model")
+    parser.add_argument("--file", help="Utterances, one per line (default: built-in samples)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            utterances = [line.strip() for line in f if line.strip()]
+    else:
+        utterances = [
+            "Turn WiFi on", "turn wifi off", "Switch the wifi on please", "Disable WiFi",
+            "Set volume to 50", "volume 20", "Set the volume to 100", "Make it louder",
+            "Open Chrome browser", "open notepad", "Launch calculator", "Open the settings app",
+            # Must be left to the model: several actions, negation, a verb inside the text
+            "turn wifi on and set volume to 20", "open chrome and search for cats",
+            "Set volume to 50 and open notepad", "Don't turn wifi on", "type open sesame",
+            # Free text the router must not trim or guess at
+            "type the letter a", "open a new tab in chrome", "search for the best pizza near me"
+        ]
+
+    tools = FUNCTIONS
+    # The reference is the model alone: no router, response cache or tool selection
+    print("Loading model...")
+    engine = Engine(*load_model())
+    model_calls = []
+    for utterance in utterances:
+        messages = [{"role": "developer", "content": DEVELOPER_PROMPT}, {"role": "user", "content": utterance}]
+        calls = engine.complete(messages, tools, route=False)["calls"]
+        model_calls.append(calls[0] if calls else None)
+
+    router = IntentRouter()
+    print(f"{'threshold':>9}  {'hit rate':>8}  {'accuracy':>8}")
+    for row in evaluate(router, utterances, tools, model_calls, [0.2, 0.25, 0.3, 0.35, 0.4, 0.5, 0.6]):
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.0%}"
+        print(f"{row['threshold']:>9.2f}  {row['hit_rate']:>8.0%}  {accuracy:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,5 @@
-FUNCTIONS = [
-    {
-        "name": "toggle_wifi",
-        "description": "Turn WiFi on or off",
-        "parameters": {
-            "state": ["on", "off"]
-        }
-    },
-    {
-        "name": "open_app",
-        "description": "Open an application",
-        "parameters": {
-            "app_name": "string"
-        }
-    },
-    {
-        "name": "set_volume",
-        "description": "Set system volume",
-        "parameters": {
-            "level": "integer (0-100)"
-        }
-    }
-]
+from functions import registry
+
+# Function-calling schemas for the tools in functions.py, built once from
+# their signatures and docstrings by the registry
+FUNCTIONS = registry.schemas()
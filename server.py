@@ -0,0 +1,247 @@
+"""
+Resident FunctionGemma server.
+
+Loads and warms the model once, then serves completions over HTTP on a TCP
+port or a Unix socket so the entry points don't reload the model per run.
+
+    python server.py                                # http://127.0.0.1:8765
+    python server.py --unix /tmp/functiongemma.sock
+    python server.py --batch-size 8                 # continuous batching
+    python server.py --constrained                  # grammar-constrained calls
+    python server.py --cache-db responses.sqlite    # persist the response cache
+    python server.py --tool-top-k 0                 # always send every tool
+    python server.py --int8                         # int8-quantized CPU model
+    python server.py --compile                      # static cache + torch.compile
+    python server.py --workers 4 --threads 2        # pre-fork worker processes
+    python server.py --workers 0                    # autotune workers x threads first
+    python server.py --metrics                      # per-stage latency on /metrics
+
+API:
+    GET  /health    -> {"status": "ok"}
+    GET  /metrics   -> per-stage latency histograms, Prometheus text (with --metrics)
+    GET  /metrics.json  the same as JSON
+    POST /generate  {"messages": [...], "tools": [...], "max_calls": 1}
+                    -> {"response": "...", "calls": [...], "elapsed": 0.42}
+                    max_new_tokens defaults to a budget derived from the tools.
+                    Pass "session": "<id>" to keep the KV cache between turns.
+    POST /generate_stream  same body as /generate; newline-delimited JSON:
+                    {"call": {...}} as each call completes, then the /generate result
+    POST /end_session  {"session": "<id>"}
+"""
+
+import argparse
+import json
+import os
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from engine import Engine, decoding_modes
+from loader import load_model
+import metrics
+import prefork
+from response_cache import ResponseCache
+from retrieval import MIN_TOOLS, ToolRetriever
+from router import IntentRouter
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Routes /health and /generate to the server's engine"""
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, metrics.prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self._send_json(200, metrics.snapshot())
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/generate", "/generate_stream", "/end_session"):
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+
+        if self.path == "/end_session":
+            self.server.engine.end_session(request.get("session"))
+            self._send_json(200, {"status": "ok"})
+            return
+
+        messages = request.get("messages")
+        if not messages:
+            self._send_json(400, {"error": "'messages' is required"})
+            return
+
+        kwargs = dict(
+            max_new_tokens=request.get("max_new_tokens"),
+            session=request.get("session"),
+            max_calls=request.get("max_calls", 1)
+        )
+
+        if self.path == "/generate_stream":
+            self._stream(messages, request.get("tools", []), kwargs)
+            return
+
+        try:
+            result = self.server.engine.complete(messages, request.get("tools", []), **kwargs)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self._send_json(200, result)
+
+    def _stream(self, messages, tools, kwargs):
+        """Write engine.stream() events as newline-delimited JSON"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for event in self.server.engine.stream(messages, tools, **kwargs):
+                self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except Exception as e:
+            self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8") + b"\n")
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[server] {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix domain socket"""
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+def make_server(engine, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    """Create an HTTP server bound to a TCP port or a Unix socket"""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.engine = engine
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident FunctionGemma inference server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Serve on this Unix socket path instead of TCP")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Merge concurrent requests with continuous batching (max sequences per step)")
+    parser.add_argument("--constrained", action="store_true",
+                        help="Grammar-constrained decoding of single-turn requests")
+    parser.add_argument("--cache-ttl", type=float, default=3600,
+                        help="Seconds to keep cached single-turn responses (0 disables the cache)")
+    parser.add_argument("--cache-db", help="SQLite file that keeps cached responses across restarts")
+    parser.add_argument("--router-threshold", type=float, default=0.3,
+                        help="Classifier score above which trivial commands skip the model (0 disables)")
+    parser.add_argument("--tool-top-k", type=int, default=4,
+                        help="Only put the k tools most relevant to a query in its prompt (0 sends all)")
+    parser.add_argument("--tool-min-catalogue", type=int, default=MIN_TOOLS,
+                        help="Send catalogues with fewer tools than this whole")
+    parser.add_argument("--int8", action="store_true",
+                        help="Int8 dynamic-quantized model for CPU (check it with quantize_check.py)")
+    parser.add_argument("--compile", action="store_true",
+                        help="Decode with a static KV cache and a torch.compile'd step (compiled at startup)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Prompt-lookup speculative decoding (drafts copied from the prompt, greedy-exact)")
+    parser.add_argument("--restricted-head", action="store_true",
+                        help="Inside calls, compute logits only for tokens the tools and prompt can use")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Forked worker processes sharing the weights (0 autotunes workers and threads)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Torch threads per worker (default: the cores divided among the workers)")
+    parser.add_argument("--autotune-seconds", type=float, default=10,
+                        help="Measurement time per workers x threads split with --workers 0")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record per-stage latency histograms, served on /metrics and /metrics.json")
+    args = parser.parse_args()
+    modes = decoding_modes(args.batch_size, args.constrained, args.compile, args.speculative, args.restricted_head)
+    if len(modes) > 1:
+        flags = {"batch_size": "--batch-size", "constrained": "--constrained", "compiled": "--compile",
+                 "speculative": "--speculative", "restricted_head": "--restricted-head"}
+        parser.error(f"{' and '.join(flags[m] for m in modes)} can't be combined; each replaces the decode loop")
+
+    if args.metrics:
+        metrics.enable()
+    if args.workers != 1:
+        # No OpenMP pool may exist in the parent when it forks
+        torch.set_num_threads(1)
+
+    print("Loading model...")
+    processor, model = load_model(quantize=args.int8)
+
+    def make_engine():
+        # Built per worker: the response cache's SQLite connection can't cross a fork
+        response_cache = None
+        if args.cache_ttl > 0:
+            response_cache = ResponseCache(ttl=args.cache_ttl, path=args.cache_db)
+        return Engine(
+            processor, model,
+            batch_size=args.batch_size,
+            constrained=args.constrained,
+            compiled=args.compile,
+            speculative=args.speculative,
+            restricted_head=args.restricted_head,
+            response_cache=response_cache,
+            router=IntentRouter(args.router_threshold) if args.router_threshold > 0 else None,
+            retriever=ToolRetriever(args.tool_top_k, min_tools=args.tool_min_catalogue) if args.tool_top_k > 0 else None
+        )
+
+    workers, threads = args.workers, args.threads
+    if workers == 0:
+        print("Autotuning workers x threads...")
+        workers, threads = prefork.autotune(make_engine, prefork.reference_prompts(), args.autotune_seconds)
+        print(f"Using {workers} worker(s) x {threads} thread(s)")
+    if workers > 1:
+        threads = threads or max(1, len(prefork.available_cpus()) // workers)
+        engine = None
+    else:
+        if threads:
+            torch.set_num_threads(threads)
+        engine = make_engine()
+        print("Warming up...")
+        engine.warm_up()
+
+    server = make_server(engine, args.host, args.port, args.unix)
+    address = f"unix:{args.unix}" if args.unix else f"http://{args.host}:{args.port}"
+    print(f"Serving FunctionGemma on {address}")
+    try:
+        if engine is None:
+            prefork.serve(server, make_engine, workers, threads)
+        else:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+if __name__ == "__main__":
+    main()
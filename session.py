@@ -0,0 +1,96 @@
+"""
+Per-conversation KV cache reuse across turns.
+
+A multi-step task re-renders the whole growing conversation every turn.
+ChatSession keeps the KV cache and the token ids it covers from the previous
+turn; the next turn only prefills tokens past the longest common prefix of the
+cached ids and the newly rendered prompt. If the rendered history diverges
+from what was cached (the template renders a tool call differently from how
+the model emitted it, or history was edited), the cache is cropped back to the
+shared prefix, and only when nothing is shared is the prompt fully re-prefilled.
+"""
+
+import torch
+from transformers import DynamicCache
+
+from prompt import PromptRenderer
+import metrics
+from stopping import stopping_criteria
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+class ChatSession:
+    """KV cache carried from one turn of a conversation to the next"""
+
+    def __init__(self, processor, model, prefix_cache=None, renderer=None):
+        self.processor = processor
+        self.renderer = renderer or PromptRenderer(processor)
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.cache = None
+        self.cached_ids = []
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.full_prefills = 0
+
+    def _prepare_cache(self, input_ids):
+        """Return how many leading tokens of input_ids the cache already covers"""
+        # Keep at least one token for the model to process
+        common = min(_common_prefix(self.cached_ids, input_ids), len(input_ids) - 1)
+
+        if self.cache is not None and common > 0:
+            if common < self.cache.get_seq_length():
+                try:
+                    # A negative count removes that many tokens from the end
+                    self.cache.crop(common - self.cache.get_seq_length())
+                except Exception:
+                    common = 0
+            if common > 0:
+                return common
+
+        # Nothing reusable: start over, from the shared prefix if there is one
+        self.full_prefills += 1
+        self.cache, cached = None, 0
+        if self.prefix_cache:
+            self.cache, cached = self.prefix_cache.match(input_ids)
+        if self.cache is None:
+            # Sliding-window layers can't be cropped once full, so keep full layers
+            self.cache = DynamicCache()
+        return cached
+
+    def generate(self, messages, tools, max_new_tokens=256, max_calls=1, **generate_kwargs):
+        """Generate the next assistant turn, reusing the cache from earlier turns"""
+        with metrics.timer("render"):
+            input_ids = self.renderer.render(messages, tools)
+        metrics.count("prompt_tokens", len(input_ids))
+        ids = torch.tensor([input_ids], device=self.model.device)
+
+        if self.prefix_cache:
+            self.prefix_cache.ensure(messages, tools)
+        cached = self._prepare_cache(input_ids)
+        self.reused_tokens += cached
+        self.prefilled_tokens += len(input_ids) - cached
+
+        with torch.no_grad():
+            out = self.model.generate(
+                input_ids=ids,
+                attention_mask=torch.ones_like(ids),
+                past_key_values=self.cache,
+                pad_token_id=self.processor.eos_token_id,
+                max_new_tokens=max_new_tokens,
+                return_dict_in_generate=True,
+                stopping_criteria=stopping_criteria(self.tokenizer, len(input_ids), max_calls),
+                **generate_kwargs
+            )
+
+        # The cache now covers the prompt plus all but the last generated token
+        self.cache = out.past_key_values
+        sequence = out.sequences[0]
+        self.cached_ids = sequence[:self.cache.get_seq_length()].tolist()
+        return self.processor.decode(sequence[len(input_ids):], skip_special_tokens=True)
@@ -0,0 +1,145 @@
+"""
+Prompt-lookup speculative decoding.
+
+Most argument values are copied from the user's text ("Chrome", "Hello
+World"), so the tokens that come next are often already in the prompt.
+PromptLookupDecoder looks up the last few generated tokens (an n-gram) in
+the prompt and the output so far, takes the tokens that followed its latest
+occurrence as a draft, and feeds the draft to the model in one forward pass
+together with the current token. The draft is accepted up to the first token
+where it differs from the model's greedy choice; that choice is appended too,
+so each pass yields at least one token and the output is exactly what greedy
+decoding produces. Rejected positions are cropped from the KV cache.
+
+    python speculative.py                 # acceptance rate and tokens/s vs plain greedy generate
+"""
+
+import torch
+from transformers import DynamicCache
+
+from stopping import MAX_BUDGET, CallStops, DecodeLoop, Totals
+
+# n-gram lengths tried for a match, longest first
+NGRAM_SIZES = (3, 2, 1)
+DRAFT_TOKENS = 8
+
+class NgramIndex:
+    """Latest position following each n-gram of a growing token list"""
+
+    def __init__(self, tokens=(), sizes=NGRAM_SIZES):
+        self.sizes = sizes
+        self.tokens = []
+        self.table = {}  # n-gram -> index of the token after its latest occurrence
+        self.extend(tokens)
+
+    def extend(self, tokens):
+        for token in tokens:
+            # An n-gram is indexed once a token follows it, so the current
+            # suffix never matches itself
+            end = len(self.tokens)
+            for n in self.sizes:
+                if end >= n:
+                    self.table[tuple(self.tokens[end - n:end])] = end
+            self.tokens.append(token)
+
+    def draft(self, limit=DRAFT_TOKENS):
+        """Tokens that followed the latest earlier occurrence of the longest matching suffix"""
+        for n in self.sizes:
+            if len(self.tokens) >= n:
+                start = self.table.get(tuple(self.tokens[-n:]))
+                if start is not None:
+                    return self.tokens[start:start + limit]
+        return []
+
+class PromptLookupDecoder:
+    """Greedy decoding with drafts copied from the prompt, verified in one forward pass"""
+
+    def __init__(self, processor, model, prefix_cache=None, draft_tokens=DRAFT_TOKENS, sizes=NGRAM_SIZES):
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.draft_tokens = draft_tokens
+        self.sizes = sizes
+        self.stops = CallStops(self.tokenizer, model)
+        self.stats = Totals("drafted", "accepted", "forward_passes", "generated")
+
+    def _forward(self, ids, cache):
+        return self.model(
+            input_ids=torch.tensor([ids], device=self.model.device), past_key_values=cache, use_cache=True
+        ).logits[0]
+
+    @torch.no_grad()
+    def generate(self, input_ids, max_new_tokens=MAX_BUDGET, max_calls=1, streamer=None):
+        """Decode a prompt (list of token ids) greedily and return the generated ids"""
+        input_ids = list(input_ids)
+        cache, cached = None, 0
+        if self.prefix_cache:
+            cache, cached = self.prefix_cache.match(input_ids)
+        if cache is None:
+            cache, cached = DynamicCache(config=self.model.config), 0
+        # Sliding-window layers keep their full states until crop() so rejected drafts can be rolled back
+        cache.activate_past_recording()
+
+        loop = DecodeLoop(self.stops, input_ids, max_new_tokens, max_calls, streamer)
+        token = int(self._forward(input_ids[cached:], cache)[-1].argmax())
+        index = NgramIndex(input_ids + [token], self.sizes)
+        generated = loop.generated
+
+        drafted = accepted = passes = 0
+        done = loop.emit([token])
+        while not done:
+            # The draft never runs past the token budget
+            draft = index.draft(min(self.draft_tokens, max_new_tokens - len(generated) - 1))
+            predicted = self._forward([generated[-1]] + draft, cache).argmax(-1).tolist()
+            n = 0
+            while n < len(draft) and draft[n] == predicted[n]:
+                n += 1
+            cache.crop(n - len(draft))
+            drafted, accepted, passes = drafted + len(draft), accepted + n, passes + 1
+
+            # The accepted draft, then the model's own token after it
+            tokens = draft[:n] + [predicted[n]]
+            done = loop.emit(tokens)
+            index.extend(tokens)
+
+        self.stats.add(drafted=drafted, accepted=accepted, forward_passes=passes + 1, generated=len(generated))
+        return loop.finish()
+
+def main():
+    import argparse
+    from benchmarks.decoders import compare, greedy, load_engine, report
+
+    parser = argparse.ArgumentParser(description="Compare prompt-lookup speculative decoding with greedy generate")
+    parser.add_argument("--draft-tokens", type=int, default=DRAFT_TOKENS, help="Max tokens per draft")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per prompt (fastest kept)")
+    args = parser.parse_args()
+
+    engine = load_engine()
+    decoder = PromptLookupDecoder(engine.processor, engine.model, draft_tokens=args.draft_tokens)
+    modes = {
+        "greedy": greedy(engine),
+        "speculative": lambda messages, input_ids, max_new_tokens: decoder.generate(input_ids, max_new_tokens)
+    }
+
+    results = []
+    before = decoder.stats.snapshot()
+    print(f"{'prompt':<50}{'tokens':>7}{'greedy ms':>11}{'spec ms':>9}{'accepted':>10}")
+    for prompt, outputs, timings in compare(engine, modes, repeat=args.repeat):
+        after = decoder.stats.snapshot()
+        drafted, accepted = after["drafted"] - before["drafted"], after["accepted"] - before["accepted"]
+        before = after
+        results.append((prompt, outputs, timings))
+        rate = f"{accepted}/{drafted}" if drafted else "-"
+        print(f"{prompt[:48]:<50}{len(outputs['speculative']):>7}{timings['greedy'] * 1000:>11.1f}"
+              f"{timings['speculative'] * 1000:>9.1f}{rate:>10}")
+
+    stats = decoder.stats
+    print(f"\nAcceptance rate: {stats['accepted'] / max(stats['drafted'], 1):.1%} "
+          f"({stats['generated'] / max(stats['forward_passes'], 1):.2f} tokens per forward pass)")
+    report(results)
+    matches = sum(outputs["greedy"] == outputs["speculative"] for _, outputs, _ in results)
+    print(f"Identical to greedy: {matches}/{len(results)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup timing report.
+
+Import this first in an entry point. With FUNCTIONGEMMA_STARTUP_REPORT=1 set,
+every module import is timed (self and cumulative time, like
+python -X importtime), milestones recorded with mark() are kept, and the
+report is printed when report() is called or at exit.
+
+    FUNCTIONGEMMA_STARTUP_REPORT=1 python interactive_demo.py
+"""
+
+import atexit
+import builtins
+import os
+import sys
+import threading
+import time
+
+START = time.perf_counter()
+ENABLED = os.environ.get("FUNCTIONGEMMA_STARTUP_REPORT", "") not in ("", "0")
+
+_original_import = builtins.__import__
+_local = threading.local()
+_lock = threading.Lock()
+_imports = []  # (module, self seconds, cumulative seconds, thread name)
+_marks = []  # (label, seconds since START)
+_reported = False
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)  # time spent in nested imports
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        with _lock:
+            _imports.append((name, cumulative - nested, cumulative, threading.current_thread().name))
+
+def mark(label):
+    """Record a startup milestone"""
+    if ENABLED:
+        with _lock:
+            _marks.append((label, time.perf_counter() - START))
+
+def report(limit=15):
+    """Print the slowest imports and the milestones (once)"""
+    global _reported
+    if not ENABLED or _reported:
+        return
+    _reported = True
+    with _lock:
+        imports = sorted(_imports, key=lambda row: row[2], reverse=True)[:limit]
+        marks = list(_marks)
+
+    print(f"\n{'import':<40}{'self ms':>10}{'cumul ms':>10}  thread", file=sys.stderr)
+    for name, own, cumulative, thread in imports:
+        print(f"{name:<40}{own * 1000:>10.1f}{cumulative * 1000:>10.1f}  {thread}", file=sys.stderr)
+    print(file=sys.stderr)
+    for label, elapsed in marks:
+        print(f"{label:<40}{elapsed * 1000:>10.0f} ms", file=sys.stderr)
+
+if ENABLED:
+    builtins.__import__ = _timed_import
+    atexit.register(report)
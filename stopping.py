@@ -0,0 +1,228 @@
+"""
+Call-aware stopping and schema-derived token budgets.
+
+Decoding stops as soon as the configured number of complete calls has been
+emitted, or as soon as a complete call is followed by anything other than
+another call (e.g. <start_function_response> or chatty trailing text).
+max_new_tokens defaults to a budget derived from the tool schemas instead of
+a fixed 128/256. Free-text values get a generous allowance that grows with
+the user's message (dictation, long queries), so the budget is only a safety
+cap and call-aware stopping is what normally ends generation.
+
+The hand-written decode loops (compiled, speculative, restricted) share
+DecodeLoop for stopping, streaming and decode metrics, and keep their
+counters in Totals.
+"""
+
+import json
+import threading
+import time
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+import metrics
+
+START_CALL = "<start_function_call>"
+END_CALL = "<end_function_call>"
+
+# Per-value token allowances for schema types without a tighter bound;
+# free-text strings get at least STRING_TOKENS, or twice the user's message
+STRING_TOKENS = 128
+STRING_ROUNDING = 32
+NUMBER_TOKENS = 8
+BOOLEAN_TOKENS = 2
+# Room for the model to open a turn or hesitate before the call
+SLACK_TOKENS = 4
+MAX_BUDGET = 512
+
+_budgets = {}
+
+def call_token_ids(tokenizer):
+    """Return the (start, end) token ids of the call markers, None where unknown"""
+    ids = []
+    for token in (START_CALL, END_CALL):
+        token_id = tokenizer.convert_tokens_to_ids(token)
+        ids.append(None if token_id == tokenizer.unk_token_id else token_id)
+    return tuple(ids)
+
+def calls_complete(generated, start_id, end_id, max_calls=1):
+    """True once max_calls calls are complete or a complete call isn't followed by another"""
+    if end_id is None or not generated:
+        return False
+    completed = generated.count(end_id)
+    if completed >= max_calls:
+        return True
+    # One token of look-ahead after the last call: another call or we're done
+    return completed > 0 and generated[-2:-1] == [end_id] and generated[-1] != start_id
+
+def eos_token_ids(model, tokenizer=None):
+    """Set of the model's end-of-sequence token ids, falling back to the tokenizer's"""
+    eos = model.generation_config.eos_token_id
+    if eos is None and tokenizer is not None:
+        eos = tokenizer.eos_token_id
+    return set(eos if isinstance(eos, (list, tuple)) else [eos] if eos is not None else [])
+
+class CallStops:
+    """Token ids that end a decode: EOS, and the call markers checked by calls_complete"""
+
+    def __init__(self, tokenizer, model):
+        self.start_id, self.end_id = call_token_ids(tokenizer)
+        self.eos_ids = eos_token_ids(model, tokenizer)
+
+    def done(self, generated, max_new_tokens, max_calls=1):
+        return (len(generated) >= max_new_tokens or generated[-1] in self.eos_ids
+                or calls_complete(generated, self.start_id, self.end_id, max_calls))
+
+class DecodeLoop:
+    """Bookkeeping of one greedy decode: stopping, streaming and decode metrics
+
+    Create it just before the prefill; it streams the prompt, and emit()
+    takes the tokens each forward pass produced. finish() counts them, ends
+    the stream and returns the generated ids.
+    """
+
+    def __init__(self, stops, input_ids, max_new_tokens, max_calls=1, streamer=None):
+        self.stops = stops
+        self.max_new_tokens = max_new_tokens
+        self.max_calls = max_calls
+        self.streamer = streamer
+        self.generated = []
+        self.last = time.perf_counter()
+        if streamer:
+            streamer.put(torch.tensor([list(input_ids)]))
+
+    def emit(self, tokens):
+        """Append one forward pass's tokens up to a stop; True once decoding should stop"""
+        if metrics.ENABLED:
+            # A pass that yields several tokens is spread evenly over them
+            now = time.perf_counter()
+            elapsed, self.last = (now - self.last) / len(tokens), now
+        for token in tokens:
+            self.generated.append(token)
+            if metrics.ENABLED:
+                metrics.observe("decode_token" if len(self.generated) > 1 else "prefill", elapsed)
+            if self.streamer:
+                self.streamer.put(torch.tensor([token]))
+            if self.stops.done(self.generated, self.max_new_tokens, self.max_calls):
+                return True
+        return False
+
+    def finish(self):
+        metrics.count("generated_tokens", len(self.generated))
+        if self.streamer:
+            self.streamer.end()
+        return self.generated
+
+class Totals:
+    """Counters a decoder keeps since startup, safe to update from several threads"""
+
+    def __init__(self, *names):
+        self.lock = threading.Lock()
+        self.values = dict.fromkeys(names, 0)
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.values[name] += count
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+class CallStoppingCriteria(StoppingCriteria):
+    """Stops generate() once the completion holds its complete function calls"""
+
+    def __init__(self, tokenizer, prompt_length, max_calls=1):
+        self.start_id, self.end_id = call_token_ids(tokenizer)
+        self.prompt_length = prompt_length
+        self.max_calls = max_calls
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = [
+            calls_complete(row[self.prompt_length:].tolist(), self.start_id, self.end_id, self.max_calls)
+            for row in input_ids
+        ]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+class DecodeTimer(StoppingCriteria):
+    """Records prefill and per-token decode latency in metrics; never stops generation"""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.first = True
+
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.perf_counter()
+        metrics.observe("prefill" if self.first else "decode_token", now - self.last)
+        metrics.count("generated_tokens", input_ids.shape[0])
+        self.first, self.last = False, now
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+def stopping_criteria(tokenizer, prompt_length, max_calls=1):
+    """Criteria for generate(): call-aware stopping, plus decode timing when metrics are on"""
+    criteria = [CallStoppingCriteria(tokenizer, prompt_length, max_calls)]
+    if metrics.ENABLED:
+        criteria.append(DecodeTimer())
+    return StoppingCriteriaList(criteria)
+
+def _token_count(tokenizer, text):
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def _value_budget(tokenizer, schema, string_tokens=STRING_TOKENS):
+    """Tokens needed for one argument value of the given JSON schema"""
+    if "enum" in schema:
+        escapes = 2 if schema.get("type", "string") == "string" else 0
+        return max(_token_count(tokenizer, str(v)) for v in schema["enum"]) + escapes
+    kind = schema.get("type", "string")
+    if kind in ("integer", "number"):
+        bounds = [schema[k] for k in ("minimum", "maximum") if k in schema]
+        if bounds:
+            # Digits are single tokens; allow a sign and a decimal part for numbers
+            digits = max(len(str(abs(int(b)))) for b in bounds)
+            return digits + 1 + (4 if kind == "number" else 0)
+        return NUMBER_TOKENS
+    if kind == "boolean":
+        return BOOLEAN_TOKENS
+    if kind == "string" and "maxLength" in schema:
+        return schema["maxLength"] + 2
+    return string_tokens + 2
+
+def _tool_budget(tokenizer, tool, string_tokens=STRING_TOKENS):
+    function = tool.get("function", tool)
+    budget = _token_count(tokenizer, f"{START_CALL}call:{function['name']}{{")
+    budget += _token_count(tokenizer, f"}}{END_CALL}")
+    properties = function.get("parameters", {}).get("properties", {})
+    for name, schema in properties.items():
+        # name, colon, value and separating comma
+        budget += _token_count(tokenizer, f"{name}:") + _value_budget(tokenizer, schema, string_tokens) + 1
+    return budget
+
+def _string_tokens(tokenizer, messages):
+    """Allowance for a free-text value: room to copy the latest user message twice over"""
+    text = next((m["content"] for m in reversed(messages or ()) if m.get("role") == "user"), None)
+    if not isinstance(text, str):
+        return STRING_TOKENS
+    needed = 2 * _token_count(tokenizer, text)
+    # Rounded up so similar messages share a cached budget
+    return max(STRING_TOKENS, -(-needed // STRING_ROUNDING) * STRING_ROUNDING)
+
+def token_budget(tokenizer, tools, max_calls=1, messages=None):
+    """max_new_tokens for a request: the largest call any tool can produce, times max_calls
+
+    messages, if given, size the allowance for free-text values. The result
+    is capped at MAX_BUDGET.
+    """
+    string_tokens = _string_tokens(tokenizer, messages)
+    key = (json.dumps(tools, sort_keys=True, default=str), max_calls, string_tokens)
+    if key not in _budgets:
+        if tools:
+            per_call = max(_tool_budget(tokenizer, tool, string_tokens) for tool in tools)
+        else:
+            per_call = string_tokens
+        # One look-ahead token per call for the stopping check
+        _budgets[key] = min(MAX_BUDGET, (per_call + 1) * max_calls + SLACK_TOKENS)
+    return _budgets[key]
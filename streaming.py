@@ -0,0 +1,84 @@
+"""
+Streaming call parsing for early dispatch.
+
+TokenStreamer receives token ids from generate() and yields decoded text as
+soon as each token arrives (TextIteratorStreamer holds text back until it sees
+whitespace, which call syntax rarely contains). StreamingCallParser consumes
+that text incrementally and returns each call the moment its closing brace
+arrives, so the caller can start executing it while decoding continues.
+"""
+
+import queue
+
+from transformers.generation.streamers import BaseStreamer
+
+from parsing import CALL, Incomplete, Malformed, parse_call, resume_after, tool_parameters
+
+class TokenStreamer(BaseStreamer):
+    """Iterator over decoded text, one chunk per generated token"""
+
+    def __init__(self, tokenizer, skip_special_tokens=True, timeout=None):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.token_ids = []
+        self.emitted = 0
+        self.skip_prompt = True
+
+    def put(self, value):
+        # The first put() from generate() is the prompt
+        if self.skip_prompt:
+            self.skip_prompt = False
+            return
+        self.token_ids.extend(value.reshape(-1).tolist())
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=self.skip_special_tokens)
+        # Hold back incomplete multi-byte characters
+        if text.endswith("�"):
+            return
+        if len(text) > self.emitted:
+            self.queue.put(text[self.emitted:])
+            self.emitted = len(text)
+
+    def end(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.queue.get(timeout=self.timeout)
+        if chunk is None:
+            raise StopIteration
+        return chunk
+
+class StreamingCallParser:
+    """Incremental extract_tool_calls: returns each call as soon as its closing brace arrives"""
+
+    def __init__(self, tools=None):
+        self.parameters = tool_parameters(tools)
+        self.buffer = ""
+        self.calls = []
+        self.position = 0  # where the next "call:" may start
+
+    def feed(self, text):
+        """Add decoded text and return the calls completed by it"""
+        self.buffer += text
+        completed = []
+        # A call can only complete on a closing brace
+        if "}" not in text:
+            return completed
+        while True:
+            match = CALL.search(self.buffer, self.position)
+            if not match:
+                return completed
+            try:
+                call, self.position = parse_call(self.buffer, match.start(), self.parameters)
+            except Incomplete:
+                self.position = match.start()
+                return completed
+            except Malformed as error:
+                self.position = resume_after(self.buffer, match, error)
+                continue
+            self.calls.append(call)
+            completed.append(call)